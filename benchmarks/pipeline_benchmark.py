@@ -0,0 +1,449 @@
+'''End-to-end pipeline benchmark against an in-process Redis and stub models.
+
+Drives the real receiver `upload_audio`, transcriber `process_batch`, merger
+`merge_blerbs` and WebSocket fan-out (`relay_updates` subscribed per room, as
+each room's first client connects, feeding the per-client pumps) in lock
+step, one tick per clip interval. Redis is a fakeredis server and Whisper/NLLB
+are deterministic stubs whose cost scales with audio length and batch size, so
+runs are repeatable and need neither a Redis server nor model weights.
+
+Reports throughput, p50/p95/p99 latency per stage and Redis round trips per
+service. Uploads beyond the receiver's TRANSCODE_WORKERS + TRANSCODE_BACKLOG
+are rejected exactly as in production and reported separately, as are clips
+the receiver drops as silent (`--silence` sets the share of noise-only
+clips). `--wire msgpack` switches every hop to the msgpack encoding and
+`--deltas` has the WebSocket clients take delta frames. `--admission`
+sets the admission control thresholds (see common/admission.py); pair it with
+`--drain-every` to build a backlog old enough to trigger them. Run from the repository root with the service dependencies plus
+`fakeredis[lua]` installed:
+
+    python benchmarks/pipeline_benchmark.py --rooms 2 --speakers 4 --clips 10
+    python benchmarks/pipeline_benchmark.py --wire msgpack --drain-every 4 --admission 0.2,0.6,1.5
+'''
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import wave
+from types import SimpleNamespace
+
+import fakeredis
+from fastapi import UploadFile
+from prometheus_client import REGISTRY
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+# The transcriber and merger run as scripts and import their sibling modules by name
+sys.path.append(os.path.join(ROOT, "transcriber", "src"))
+sys.path.append(os.path.join(ROOT, "merger", "src"))
+# Every service creates its audio directory at import time
+os.environ.setdefault("SHARED_VOLUME_PATH", tempfile.mkdtemp(prefix="bench_volume_"))
+
+# pylint: disable=wrong-import-position
+from common.keys import TRANSCRIBER_QUEUE, unmerged_queue, update_seq
+from common.queue_consumer import QueueConsumer
+from common import wire
+import merger as merger_service  # merger/src/merger.py; the module shadows the merger/ directory
+import receiver.src.blerb_receiver as receiver_service
+import transcriber.src.transcriber_worker as transcriber_service
+import websocket.src.websocket as websocket_service
+import stitcher
+import common.admission as admission
+
+SAMPLE_RATE = 16000
+STAGES = ["upload", "queue_wait", "transcribe", "merge", "fanout", "end_to_end"]
+
+# ─── Round-Trip Counting Clients ─────────────────────────────────────────────
+class CountingFakeRedis(fakeredis.FakeRedis):
+    '''Fake Redis that counts round trips; a pipeline execute counts as one.'''
+    round_trips = 0
+
+    def execute_command(self, *args, **options):
+        self.round_trips += 1
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        def counted_execute(raise_on_error=True):
+            self.round_trips += 1
+            return execute(raise_on_error)
+
+        pipe.execute = counted_execute
+        return pipe
+
+class CountingFakeAsyncRedis(fakeredis.FakeAsyncRedis):
+    '''Async fake Redis that counts round trips; a pipeline execute counts as one.'''
+    round_trips = 0
+
+    async def execute_command(self, *args, **options):
+        self.round_trips += 1
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        async def counted_execute(raise_on_error=True):
+            self.round_trips += 1
+            return await execute(raise_on_error)
+
+        pipe.execute = counted_execute
+        return pipe
+
+# ─── Stub Models ─────────────────────────────────────────────────────────────
+class StubWhisper:
+    '''Deterministic Whisper stand-in; costs `rtf` seconds per second of audio,
+    plus `encoder_ms` per 30 s window the audio is padded to.'''
+
+    def __init__(self, rtf, detect_ms, encoder_ms=0):
+        self.rtf = rtf
+        self.detect_ms = detect_ms
+        self.encoder_ms = encoder_ms
+
+    def detect_language(self, audio=None, **_options):
+        time.sleep(self.detect_ms / 1000)
+        return "en", 0.97, [("en", 0.97), ("es", 0.02), ("ar", 0.01)]
+
+    def transcribe(self, audio, language=None, **_options):
+        duration = len(audio) / SAMPLE_RATE
+        time.sleep(duration * self.rtf + math.ceil(duration / 30) * self.encoder_ms / 1000)
+        # Derive the words from the audio so repeated clips transcribe identically
+        seed = int(abs(float(audio[: SAMPLE_RATE // 10].sum())) * 1000) % 10007
+        words = [f"word{(seed + i) % 97}" for i in range(max(1, int(duration * 2)))]
+        # Five-word sentences, so translation sees multi-sentence utterances
+        sentences = [" ".join(words[i:i + 5]).capitalize() + "." for i in range(0, len(words), 5)]
+        # Two words per second, so each five-word sentence spans 2.5s of the audio
+        segments = [
+            SimpleNamespace(start=2.5 * i, end=min(duration, 2.5 * (i + 1)), text=" " + sentence, avg_logprob=-0.3)
+            for i, sentence in enumerate(sentences)
+        ]
+        info = SimpleNamespace(language=language or "en", language_probability=1.0, duration=duration)
+        return iter(segments), info
+
+class StubNLLB:
+    '''NLLB backend stand-in; one batch costs a fixed overhead plus a per-sentence share.'''
+
+    def __init__(self, base_ms, item_ms):
+        self.base_ms = base_ms
+        self.item_ms = item_ms
+
+    def translate(self, sentences, _src_lang, tgt_lang, _beam_size):
+        time.sleep((self.base_ms + self.item_ms * len(sentences)) / 1000)
+        return [f"[{tgt_lang}] {sentence}" for sentence in sentences]
+
+# ─── Fake WebSocket ──────────────────────────────────────────────────────────
+class FakeSocket:
+    '''Collects what the server would send to a browser.'''
+
+    def __init__(self):
+        self.received = 0
+        self.received_bytes = 0
+
+    async def send_text(self, text):
+        self.received += 1
+        self.received_bytes += len(text.encode())
+
+    async def send_bytes(self, data):
+        self.received += 1
+        self.received_bytes += len(data)
+
+    async def close(self):
+        pass
+
+# ─── Helpers ─────────────────────────────────────────────────────────────────
+def make_wav(seconds, seed, silent=False):
+    '''Synthesize a mono 16kHz WAV clip (tone plus noise, or faint noise only if `silent`) as bytes.'''
+    rng = random.Random(seed)
+    frequency = 180 + seed % 200
+    amplitude, noise = (0.0, 0.002) if silent else (0.3, 0.05)
+    frames = bytearray()
+    for i in range(int(seconds * SAMPLE_RATE)):
+        value = amplitude * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE) + noise * rng.uniform(-1, 1)
+        frames += int(value * 32767).to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+def percentile(values, pct):
+    '''Nearest-rank percentile of a list of numbers.'''
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def wire_services(args, server):
+    '''Point every service at the fake Redis server and stub models; returns the counting clients.'''
+    clients = {
+        "receiver": CountingFakeAsyncRedis(server=server, decode_responses=True),
+        "receiver_binary": CountingFakeAsyncRedis(server=server, decode_responses=False),
+        "transcriber": CountingFakeRedis(server=server, decode_responses=True),
+        "transcriber_binary": CountingFakeRedis(server=server, decode_responses=False),
+        "merger": CountingFakeRedis(server=server, decode_responses=True),
+        "merger_binary": CountingFakeRedis(server=server, decode_responses=False),
+        "websocket": CountingFakeAsyncRedis(server=server, decode_responses=True),
+        "websocket_binary": CountingFakeAsyncRedis(server=server, decode_responses=False),
+    }
+    wire.WIRE_FORMAT = args.wire
+
+    receiver_service.redis_client = clients["receiver"]
+    receiver_service.redis_binary = clients["receiver_binary"]
+    receiver_service.AUDIO_TRANSPORT = "redis" if receiver_service.pcm_available() else "file"
+
+    transcriber_service.redis_client = clients["transcriber"]
+    transcriber_service.redis_binary = clients["transcriber_binary"]
+    transcriber_service.queue_consumer = QueueConsumer(
+        clients["transcriber_binary"], TRANSCRIBER_QUEUE, consumer_id="bench"
+    )
+    transcriber_service.whisper_model = StubWhisper(args.asr_rtf, args.detect_ms, args.encoder_ms)
+    transcriber_service.batched_whisper = None
+    transcriber_service.nllb = StubNLLB(args.mt_base_ms, args.mt_item_ms)
+    transcriber_service.BATCH_SIZE = args.batch_size
+    transcriber_service.STREAM_PARTIALS = args.stream
+    stitcher.STITCH_ENABLED = not args.no_stitch
+    transcriber_service.CLAIM_LIMIT = args.batch_size * (1 if args.no_stitch else stitcher.STITCH_MAX_CLIPS)
+    transcriber_service.translation_cache.redis_client = clients["transcriber"]
+    transcriber_service.language_memory.redis_client = clients["transcriber"]
+    if args.admission:
+        degrade, shed, reject = (float(seconds) for seconds in args.admission.split(","))
+        admission.ADMISSION_DEGRADE_SECONDS = degrade
+        admission.ADMISSION_SHED_SECONDS = transcriber_service.ADMISSION_SHED_SECONDS = shed
+        admission.ADMISSION_REJECT_SECONDS = reject
+    transcriber_service.admission = admission.AdmissionController(clients["transcriber_binary"])
+    receiver_service.ADMISSION_CACHE_SECONDS = 0
+
+    merger_service.redis_client = clients["merger"]
+    merger_service.redis_binary = clients["merger_binary"]
+    merger_service.unmerged_consumer = QueueConsumer(
+        clients["merger_binary"], unmerged_queue(None), consumer_id="bench"
+    )
+
+    websocket_service.redis_client = clients["websocket"]
+    websocket_service.redis_binary = clients["websocket_binary"]
+    return clients
+
+async def connect_clients(rooms, per_room, wire_format, deltas):
+    '''Register fake browser connections with the WebSocket server and start their pumps.
+
+    Each room is subscribed when its first client registers, as the endpoint does.'''
+    sockets, tasks = [], []
+    for room_id in rooms:
+        for index in range(per_room):
+            socket = FakeSocket()
+            queue = asyncio.Queue(maxsize=websocket_service.SEND_QUEUE_SIZE)
+            websocket_service.clients.setdefault(room_id, {})[socket] = queue
+            if index == 0:
+                await websocket_service.subscribe_room(room_id)
+            tasks.append(asyncio.create_task(websocket_service.pump(socket, queue, 0, wire_format, deltas)))
+            sockets.append(socket)
+    return sockets, tasks
+
+async def start_relay():
+    '''Start the WebSocket server's subscriber; returns its task and a count of updates it has relayed.'''
+    relayed = [0]
+    broadcast = websocket_service.broadcast
+
+    def counted_broadcast(room_id, message):
+        relayed[0] += 1
+        broadcast(room_id, message)
+
+    websocket_service.broadcast = counted_broadcast
+    task = asyncio.create_task(websocket_service.relay_updates())
+    while websocket_service.subscriber is None:
+        await asyncio.sleep(0)
+    return task, relayed
+
+async def wait_for_fanout(observer, relayed):
+    '''Wait for the relay to pass on every update published to a subscribed room, then for the pumps.
+
+    Each published line takes a seq, so the rooms' seq counters total the updates to expect.'''
+    rooms = list(websocket_service.clients)
+    seqs = observer.mget([update_seq(room_id) for room_id in rooms]) if rooms else []
+    published = sum(int(seq or 0) for seq in seqs)
+    while relayed[0] < published:
+        await asyncio.sleep(0.0005)
+    while any(not queue.empty() for room in websocket_service.clients.values() for queue in room.values()):
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+def clip_id(payload):
+    '''Identity of a clip as it travels through the pipeline.'''
+    return (payload.get("room_id"), payload.get("speaker_id"), payload.get("timestamp"))
+
+# ─── Benchmark ───────────────────────────────────────────────────────────────
+async def run(args):
+    '''Run the scenario and print the report.'''
+    server = fakeredis.FakeServer()
+    clients = wire_services(args, server)
+    # Reads what the merger published, outside the counted clients
+    observer = fakeredis.FakeRedis(server=server, decode_responses=True)
+    relay, relayed = await start_relay()
+
+    rooms = [f"room{r}" for r in range(args.rooms)]
+    speakers = [(room_id, f"{room_id}-speaker{s}") for room_id in rooms for s in range(args.speakers)]
+    sockets, pumps = await connect_clients(rooms, args.clients_per_room, args.wire, args.deltas)
+    clip_interval_ms = 1000 / args.clip_rate
+    base_ts = int(time.time() * 1000)
+    wavs = [make_wav(args.clip_seconds, seed) for seed in range(8)]
+    silent_wav = make_wav(args.clip_seconds, 0, silent=True)
+    silence_rng = random.Random(0)
+
+    latencies = {stage: [] for stage in STAGES}
+    started, enqueued = {}, {}
+    rejected, silent = [], []
+    bench_start = time.perf_counter()
+
+    for tick in range(args.clips):
+        timestamp = int(base_ts + tick * clip_interval_ms)
+
+        # Receiver: every speaker uploads one clip this tick
+        async def upload(index, room_id, speaker_id):
+            key = (room_id, speaker_id, timestamp)
+            started[key] = time.perf_counter()
+            wav = silent_wav if silence_rng.random() < args.silence else wavs[(tick + index) % len(wavs)]
+            response = await receiver_service.upload_audio(
+                file=UploadFile(file=io.BytesIO(wav), filename="clip.wav"),
+                speaker_id=speaker_id, timestamp=timestamp,
+                prim_lang="en", fall_lang="es", room_id=room_id
+            )
+            if response.status_code != 200:
+                rejected.append(key)
+                return
+            if json.loads(response.body).get("status") == "dropped":
+                silent.append(key)
+                return
+            enqueued[key] = time.perf_counter()
+            latencies["upload"].append(enqueued[key] - started[key])
+
+        await asyncio.gather(*(upload(i, room_id, speaker_id) for i, (room_id, speaker_id) in enumerate(speakers)))
+
+        # Transcriber: drain the queue in batches (every --drain-every ticks, to build a backlog)
+        drain = (tick + 1) % args.drain_every == 0 or tick == args.clips - 1
+        while drain and clients["transcriber"].llen(TRANSCRIBER_QUEUE):
+            transcriber_service.admission.update()
+            batch = transcriber_service.collect_batch()
+            batch_start = time.perf_counter()
+            keys = [clip_id(wire.loads(item)) for item in batch]
+            for key in keys:
+                latencies["queue_wait"].append(batch_start - enqueued[key])
+            transcriber_service.process_batch(batch)
+            batch_done = time.perf_counter()
+            for key in keys:
+                latencies["transcribe"].append(batch_done - batch_start)
+
+        # Merger: one tick over everything transcribed
+        merge_start = time.perf_counter()
+        blerbs, items = merger_service.get_unmerged_blerbs(0.01)
+        merger_service.merge_blerbs(blerbs)
+        merger_service.unmerged_consumer.ack(*items)
+        merge_done = time.perf_counter()
+        latencies["merge"].extend(merge_done - merge_start for _ in blerbs)
+
+        # WebSocket: the relay passes on what the merger published and the pumps send it
+        await wait_for_fanout(observer, relayed)
+        fanout_done = time.perf_counter()
+        latencies["fanout"].append(fanout_done - merge_done)
+        for blerb in blerbs:
+            if blerb.get("partial"):
+                continue
+            key = (blerb["room_id"], blerb["speaker_id"], blerb["start_timestamp"])
+            latencies["end_to_end"].append(fanout_done - started[key])
+
+    elapsed = time.perf_counter() - bench_start
+    for task in pumps + [relay]:
+        task.cancel()
+
+    # Reconnect cost: full catch-up versus resuming from a cursor halfway through
+    room_id = rooms[0]
+    catch_up_trips = {}
+    latest = int(await clients["websocket"].get(websocket_service.update_seq(room_id)) or 0)
+    for label, cursor in (("fresh", 0), ("resume", latest // 2)):
+        before = clients["websocket"].round_trips
+        await websocket_service.catch_up(FakeSocket(), room_id, cursor)
+        catch_up_trips[label] = clients["websocket"].round_trips - before
+
+    total_clips = len(speakers) * args.clips
+    print("\n=== Pipeline benchmark ===")
+    print(f"Rooms: {args.rooms}  Speakers/room: {args.speakers}  Clips/speaker: {args.clips}  "
+          f"Clip rate: {args.clip_rate}/s  Batch size: {args.batch_size}  "
+          f"Audio transport: {receiver_service.AUDIO_TRANSPORT}  Wire: {args.wire}"
+          f"{' + deltas' if args.deltas else ''}")
+    accepted = total_clips - len(rejected) - len(silent)
+    print(f"Throughput: {accepted / elapsed:.1f} clips/s ({accepted} clips in {elapsed:.2f}s, "
+          f"{len(rejected)} rejected by back-pressure, {len(silent)} dropped as silent)")
+    print(f"Messages delivered to {len(sockets)} client(s): {sum(s.received for s in sockets)} "
+          f"({sum(s.received_bytes for s in sockets)} bytes)")
+    lookups = {
+        result: REGISTRY.get_sample_value("translator_translation_cache_total", {"result": result}) or 0
+        for result in ("hit_local", "hit_redis", "miss")
+    }
+    partials = REGISTRY.get_sample_value("translator_first_partial_seconds_count") or 0
+    if partials:
+        first_partial = REGISTRY.get_sample_value("translator_first_partial_seconds_sum") / partials
+        print(f"First partial: {first_partial * 1000:.2f}ms mean after upload ({partials:.0f} clips)")
+    print(f"Translation cache: {lookups['hit_local']:.0f} local hit(s), {lookups['hit_redis']:.0f} Redis hit(s), "
+          f"{lookups['miss']:.0f} miss(es)")
+    deduped = REGISTRY.get_sample_value("translator_dedup_tokens_total", {"field": "text"}) or 0
+    print(f"Clip-boundary dedup: {deduped:.0f} repeated token(s) dropped")
+    decisions = {
+        decision: REGISTRY.get_sample_value("translator_admission_decisions_total", {"decision": decision}) or 0
+        for decision in ("degraded", "shed", "rejected")
+    }
+    print(f"Admission: {decisions['degraded']:.0f} clip(s) degraded, {decisions['shed']:.0f} shed, "
+          f"{decisions['rejected']:.0f} upload(s) rejected")
+    skipped = REGISTRY.get_sample_value("translator_language_resolution_total", {"outcome": "remembered"}) or 0
+    print(f"Language detection skipped: {skipped:.0f} window(s) decoded in the speaker's remembered language")
+    windows = REGISTRY.get_sample_value("translator_whisper_windows_total") or 0
+    window_clips = REGISTRY.get_sample_value("translator_whisper_window_clips_total") or 0
+    print(f"Whisper windows: {windows:.0f} for {window_clips:.0f} clip(s)")
+    print(f"\n{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'n':>8}")
+    for stage in STAGES:
+        values = [v * 1000 for v in latencies[stage]]
+        print(f"{stage:<12}{percentile(values, 50):>10.2f}{percentile(values, 95):>10.2f}"
+              f"{percentile(values, 99):>10.2f}{len(values):>8}")
+    print("\nRedis round trips")
+    for name, client in clients.items():
+        print(f"  {name:<20}{client.round_trips:>8}  ({client.round_trips / total_clips:.2f}/clip)")
+    print(f"  catch-up fresh      {catch_up_trips['fresh']:>8}")
+    print(f"  catch-up resume     {catch_up_trips['resume']:>8}")
+
+def main():
+    '''Parse arguments and run the benchmark.'''
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=1)
+    parser.add_argument("--speakers", type=int, default=2, help="speakers per room")
+    parser.add_argument("--clips", type=int, default=20, help="clips per speaker")
+    parser.add_argument("--clip-rate", type=float, default=0.2, help="clips per second per speaker")
+    parser.add_argument("--clip-seconds", type=float, default=5.0)
+    parser.add_argument("--drain-every", type=int, default=1,
+                        help="ticks between transcriber drains; above 1 builds a backlog to stitch")
+    parser.add_argument("--admission", metavar="DEGRADE,SHED,REJECT",
+                        help="admission thresholds in seconds of queue age, e.g. 0.2,0.5,1")
+    parser.add_argument("--silence", type=float, default=0.0, help="share of uploads that are silent")
+    parser.add_argument("--clients-per-room", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=1, help="transcriber batch size")
+    parser.add_argument("--stream", action="store_true", help="stream partial transcripts per segment")
+    parser.add_argument("--wire", choices=("json", "msgpack"), default="json", help="encoding of every hop")
+    parser.add_argument("--deltas", action="store_true", help="WebSocket clients take delta frames")
+    parser.add_argument("--no-stitch", action="store_true", help="decode every clip in its own Whisper window")
+    parser.add_argument("--asr-rtf", type=float, default=0.02, help="stub Whisper seconds per audio second")
+    parser.add_argument("--encoder-ms", type=float, default=0,
+                        help="stub Whisper fixed cost per 30s encoder window")
+    parser.add_argument("--detect-ms", type=float, default=2.0, help="stub language detection cost")
+    parser.add_argument("--mt-base-ms", type=float, default=5.0, help="stub NLLB cost per batch")
+    parser.add_argument("--mt-item-ms", type=float, default=1.0, help="stub NLLB cost per batched item")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
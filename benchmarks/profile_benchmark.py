@@ -0,0 +1,175 @@
+'''Real-time factor and accuracy of each transcriber inference profile.
+
+Loads every profile's real models in turn and runs the transcriber's own
+decode and translation code over a manifest of reference clips, one JSON
+object per line:
+
+    {"audio": "clips/hello.wav", "language": "en", "text": "Hello there.", "translation": "مرحبا."}
+
+`translation` is optional. Audio paths are relative to the manifest. Reports
+model load time, real-time factor (processing seconds per audio second) for
+ASR, translation and both, Whisper WER against `text` and chrF against
+`translation`:
+
+    python benchmarks/profile_benchmark.py clips/manifest.jsonl --profiles fast balanced
+'''
+import argparse
+import gc
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+# The transcriber runs as a script and imports its sibling modules by name
+sys.path.append(os.path.join(ROOT, "transcriber", "src"))
+os.environ.setdefault("SHARED_VOLUME_PATH", tempfile.mkdtemp(prefix="bench_volume_"))
+
+# pylint: disable=wrong-import-position
+import torch
+from faster_whisper import decode_audio
+from common.model_registry import ModelRegistry
+from profiles import PROFILES
+from sentences import split_sentences
+import transcriber_worker as worker
+
+SAMPLE_RATE = 16000
+
+# ─── Accuracy Metrics ────────────────────────────────────────────────────────
+def words(text):
+    '''Lower-cased words without punctuation, for WER.'''
+    return re.sub(r"[^\w\s']", " ", text.casefold()).split()
+
+def word_errors(hypothesis, reference):
+    '''Word-level edit distance between two texts.'''
+    hyp, ref = words(hypothesis), words(reference)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+def chrf(hypothesis, reference, max_order=6, beta=2):
+    '''Character n-gram F-score (chrF, 0-100), whitespace ignored.'''
+    hyp, ref = "".join(hypothesis.split()), "".join(reference.split())
+    precisions, recalls = [], []
+    for n in range(1, max_order + 1):
+        hyp_ngrams = Counter(hyp[i:i + n] for i in range(len(hyp) - n + 1))
+        ref_ngrams = Counter(ref[i:i + n] for i in range(len(ref) - n + 1))
+        if not hyp_ngrams or not ref_ngrams:
+            continue
+        matches = sum((hyp_ngrams & ref_ngrams).values())
+        precisions.append(matches / sum(hyp_ngrams.values()))
+        recalls.append(matches / sum(ref_ngrams.values()))
+    if not precisions:
+        return 0.0
+    precision, recall = sum(precisions) / len(precisions), sum(recalls) / len(recalls)
+    if precision + recall == 0:
+        return 0.0
+    return 100 * (1 + beta ** 2) * precision * recall / (beta ** 2 * precision + recall)
+
+# ─── Benchmark ───────────────────────────────────────────────────────────────
+def load_manifest(path):
+    '''Read the reference clips and decode their audio once for every profile.'''
+    clips = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                clip = json.loads(line)
+                clip["samples"] = decode_audio(
+                    os.path.join(os.path.dirname(os.path.abspath(path)), clip["audio"]), sampling_rate=SAMPLE_RATE
+                )
+                clips.append(clip)
+    return clips
+
+def run_clip(clip):
+    '''Transcribe and translate one clip the way the worker does; returns (text, translation, asr s, mt s).'''
+    start = time.perf_counter()
+    text = worker.decode_in(clip["samples"], clip["language"], worker.PRIMARY_DECODE_OPTIONS)
+    asr_done = time.perf_counter()
+
+    translation = ""
+    src_lang = worker.ISO2NLLB.get(clip["language"])
+    sentences = split_sentences(text)
+    if sentences and src_lang:
+        settings = worker.TRANSLATION_TIERS[worker.TRANSLATION_TIER]
+        translated = worker.generate_translations(sentences, src_lang, worker.target_language(src_lang), settings)
+        translation = " ".join(part for part in translated if part)
+    return text, translation, asr_done - start, time.perf_counter() - asr_done
+
+def benchmark_profile(name, clips, warmup):
+    '''Load a profile's models, run every clip and summarize.'''
+    worker.use_profile(name)
+    # A fresh registry per profile, so each profile's models actually load
+    worker.model_registry = ModelRegistry(required=("whisper",))
+    start = time.perf_counter()
+    worker.load_models()
+    worker.model_registry.wait("whisper")
+    worker.model_registry.wait("nllb")
+    load_seconds = time.perf_counter() - start
+
+    for clip in clips[:warmup]:
+        run_clip(clip)
+
+    audio_seconds = asr_seconds = mt_seconds = 0.0
+    errors = reference_words = 0
+    chrf_scores = []
+    for clip in clips:
+        text, translation, asr, mt = run_clip(clip)
+        audio_seconds += len(clip["samples"]) / SAMPLE_RATE
+        asr_seconds += asr
+        mt_seconds += mt
+        errors += word_errors(text, clip["text"])
+        reference_words += len(words(clip["text"]))
+        if clip.get("translation"):
+            chrf_scores.append(chrf(translation, clip["translation"]))
+        print(f"  {clip['audio']}: {text!r} -> {translation!r}")
+
+    # Free this profile's models before the next one loads
+    worker.whisper_model = worker.batched_whisper = worker.nllb = None
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+    return {
+        "profile": name,
+        "load_s": load_seconds,
+        "asr_rtf": asr_seconds / audio_seconds,
+        "mt_rtf": mt_seconds / audio_seconds,
+        "rtf": (asr_seconds + mt_seconds) / audio_seconds,
+        "wer": 100 * errors / max(1, reference_words),
+        "chrf": sum(chrf_scores) / len(chrf_scores) if chrf_scores else float("nan"),
+    }
+
+def main():
+    '''Parse arguments, benchmark each profile and print a comparison table.'''
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSONL file of reference clips")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=sorted(PROFILES))
+    parser.add_argument("--warmup", type=int, default=1, help="clips run untimed after loading each profile")
+    args = parser.parse_args()
+
+    clips = load_manifest(args.manifest)
+    audio_seconds = sum(len(clip["samples"]) for clip in clips) / SAMPLE_RATE
+    print(f"🎧 {len(clips)} clip(s), {audio_seconds:.1f}s of audio, device {worker.DEVICE}")
+
+    results = []
+    for name in args.profiles:
+        print(f"\n▶️  Profile {name}")
+        results.append(benchmark_profile(name, clips, args.warmup))
+
+    print("\n=== Profile benchmark ===")
+    print(f"{'profile':<10}{'load s':>8}{'ASR RTF':>9}{'MT RTF':>8}{'RTF':>7}{'WER %':>8}{'chrF':>7}")
+    for result in results:
+        print(f"{result['profile']:<10}{result['load_s']:>8.1f}{result['asr_rtf']:>9.3f}{result['mt_rtf']:>8.3f}"
+              f"{result['rtf']:>7.3f}{result['wer']:>8.1f}{result['chrf']:>7.1f}")
+    print("RTF < 1 keeps up with real time; the pipeline needs headroom for detection and queueing.")
+
+if __name__ == "__main__":
+    main()
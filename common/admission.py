@@ -0,0 +1,147 @@
+'''Admission control: keeps caption latency bounded when the transcriber falls behind.
+
+The age of the oldest clip waiting in translator:queue is the latency every
+new upload will at least see, so it drives four levels:
+
+  normal   nothing changes
+  degrade  transcribers switch to cheap search settings (greedy decode, no
+           sampling, no fallback-language retry, fast translation tier)
+  shed     as degrade, and transcribers drop claimed clips older than
+           ADMISSION_SHED_SECONDS instead of captioning them minutes late
+  reject   as shed, and the receiver turns uploads away with a 503
+
+A level is entered once the queue age reaches its threshold and left only
+once the age falls below ADMISSION_RECOVERY_RATIO of it, so the pipeline
+does not flap at a boundary. Transcribers run the controller and publish the
+level under ADMISSION_KEY; the key expires, so a stopped controller never
+leaves the receiver rejecting. Set a threshold to 0 to disable its level.
+'''
+import os
+import threading
+import time
+from prometheus_client import Counter, Gauge
+
+from common.keys import ADMISSION_KEY, TRANSCRIBER_QUEUE
+from common import wire
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_DEGRADE_SECONDS = float(os.getenv("ADMISSION_DEGRADE_SECONDS", "5"))
+ADMISSION_SHED_SECONDS = float(os.getenv("ADMISSION_SHED_SECONDS", "20"))
+ADMISSION_REJECT_SECONDS = float(os.getenv("ADMISSION_REJECT_SECONDS", "40"))
+ADMISSION_RECOVERY_RATIO = float(os.getenv("ADMISSION_RECOVERY_RATIO", "0.5"))
+ADMISSION_INTERVAL_SECONDS = float(os.getenv("ADMISSION_INTERVAL_SECONDS", "1"))
+ADMISSION_KEY_TTL = int(os.getenv("ADMISSION_KEY_TTL", "10"))
+
+LEVELS = ("normal", "degrade", "shed", "reject")
+
+QUEUE_AGE = Gauge("translator_queue_age_seconds", "Age of the oldest clip waiting for a transcriber")
+ADMISSION_LEVEL = Gauge("translator_admission_level", "Admission level: 0 normal, 1 degrade, 2 shed, 3 reject")
+ADMISSION_TRANSITIONS = Counter(
+    "translator_admission_transitions_total", "Admission level changes, by the level entered", ["level"]
+)
+ADMISSION_DECISIONS = Counter(
+    "translator_admission_decisions_total", "Clips degraded or shed and uploads rejected by admission control",
+    ["decision"]
+)
+
+def thresholds():
+    '''Queue age in seconds that triggers each level above normal.'''
+    return {"degrade": ADMISSION_DEGRADE_SECONDS, "shed": ADMISSION_SHED_SECONDS, "reject": ADMISSION_REJECT_SECONDS}
+
+def at_least(level, minimum):
+    '''Whether `level` is `minimum` or more severe.'''
+    return LEVELS.index(level) >= LEVELS.index(minimum)
+
+def next_level(age, current="normal"):
+    '''The level a queue age calls for, given the current level (for hysteresis).'''
+    level = "normal"
+    for name, threshold in thresholds().items():
+        if threshold <= 0:
+            continue
+        # Stay at a level until the backlog is well below what triggered it
+        held = at_least(current, name) and age >= threshold * ADMISSION_RECOVERY_RATIO
+        if age >= threshold or held:
+            level = name
+    return level
+
+def clip_age(payload, now):
+    '''Seconds since a queued clip was received; 0 for payloads without timings.'''
+    received = (payload.get("timings") or {}).get("received")
+    return max(0.0, now - received) if received else 0.0
+
+def queue_age(item, now):
+    '''Age of a raw queue item (the queue's head), or 0 for an empty queue or an unreadable item.'''
+    if item is None:
+        return 0.0
+    try:
+        return clip_age(wire.loads(item), now)
+    except ValueError:
+        return 0.0
+
+def record(decision, count=1):
+    '''Count an admission decision: "degraded", "shed" or "rejected".'''
+    if count:
+        ADMISSION_DECISIONS.labels(decision).inc(count)
+
+def parse_level(value):
+    '''A level read back from ADMISSION_KEY; anything unknown (or missing) is normal.'''
+    if isinstance(value, bytes):
+        value = value.decode()
+    return value if value in LEVELS else "normal"
+
+
+class AdmissionController:
+    '''Watches the transcriber queue's age and publishes the admission level it calls for.
+
+    `update` takes one reading; `start` takes one every ADMISSION_INTERVAL_SECONDS
+    on a daemon thread, so the level stays current while a long batch runs.
+    Queue items may be msgpack, so `client` must not decode replies.
+    '''
+
+    def __init__(self, client, queue=TRANSCRIBER_QUEUE, interval=ADMISSION_INTERVAL_SECONDS):
+        self.client = client
+        self.queue = queue
+        self.interval = interval
+        self.level = "normal"
+        self._stop = threading.Event()
+        self._thread = None
+
+    def update(self, now=None):
+        '''Read the queue's head, move to the level its age calls for and publish it.'''
+        age = queue_age(self.client.lindex(self.queue, 0), now or time.time())
+        level = next_level(age, self.level)
+        QUEUE_AGE.set(age)
+        if level != self.level:
+            ADMISSION_TRANSITIONS.labels(level).inc()
+            print(f"🚦 Admission level {self.level} -> {level} (oldest queued clip {age:.1f}s old)")
+            self.level = level
+        ADMISSION_LEVEL.set(LEVELS.index(level))
+        self.client.set(ADMISSION_KEY, level, ex=ADMISSION_KEY_TTL)
+        return level
+
+    def at_least(self, minimum):
+        '''Whether the current level is `minimum` or more severe.'''
+        return at_least(self.level, minimum)
+
+    def start(self):
+        '''Start updating in the background; does nothing with ADMISSION_ENABLED=0.'''
+        if not ADMISSION_ENABLED or self._thread is not None:
+            return
+        self.update()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="admission")
+        self._thread.start()
+
+    def stop(self):
+        '''Stop the background updates.'''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.update()
+            except Exception as e:
+                print(f"⚠️ Admission update failed: {e}")
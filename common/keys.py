@@ -0,0 +1,52 @@
+'''Redis key and channel names shared across services, namespaced per room.'''
+
+# Rooms (sessions) keep their transcripts, indexes and channels apart. Clients
+# that do not send a room id all land in the default room.
+DEFAULT_ROOM = "default"
+
+# Clips waiting for a transcriber; shared by every room
+TRANSCRIBER_QUEUE = "translator:queue"
+
+# Admission level the transcribers publish for the receiver (see common/admission.py)
+ADMISSION_KEY = "translator:admission"
+
+# Merged transcript lines: translator:transcription:{room}:{speaker}:{ts}
+TRANSCRIPTION_PREFIX = "translator:transcription"
+
+# Per-room indexes over merged lines: translator:index:{room}:...
+INDEX_PREFIX = "translator:index"
+
+# Per-room pub/sub channels the merger publishes changed lines (and clears) on
+UPDATES_CHANNEL_PREFIX = "translator:updates"
+
+def unmerged_queue(node=None):
+    '''Queue of transcribed blerbs waiting for a merger node (or the single merger).'''
+    return f"translator:unmerged:{node}" if node else "translator:unmerged"
+
+def line_key(room_id, speaker_id, timestamp):
+    '''Key of a merged transcript line.'''
+    return f"{TRANSCRIPTION_PREFIX}:{room_id}:{speaker_id}:{timestamp}"
+
+def line_index(room_id):
+    '''ZSET line key -> start_timestamp, for paging a room's history.'''
+    return f"{INDEX_PREFIX}:{room_id}:lines"
+
+def update_index(room_id):
+    '''ZSET line key -> seq of its latest write, for resuming a room.'''
+    return f"{INDEX_PREFIX}:{room_id}:updates"
+
+def final_lines(room_id):
+    '''HASH line key -> line, holding a room's finalized lines once compacted out of their own keys.'''
+    return f"{INDEX_PREFIX}:{room_id}:final"
+
+def update_seq(room_id):
+    '''Monotonic per-room write counter; survives clears so cursors stay valid.'''
+    return f"{INDEX_PREFIX}:{room_id}:seq"
+
+def updates_channel(room_id):
+    '''Channel carrying a room's line updates.'''
+    return f"{UPDATES_CHANNEL_PREFIX}:{room_id}"
+
+def room_from_channel(channel):
+    '''Inverse of `updates_channel`.'''
+    return channel[len(UPDATES_CHANNEL_PREFIX) + 1:]
@@ -0,0 +1,132 @@
+'''Prometheus metrics and per-utterance stage timings shared across services.
+
+Every clip carries a `timings` dict of stage -> wall-clock seconds through the
+queues. Each service stamps the stages it completes with `mark`, which also
+observes how long the clip spent since the previous stamped stage, so the
+`translator_stage_seconds` histograms add up to the end-to-end latency. Stamps
+come from different hosts, so stage times include any clock skew between them.
+'''
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlparse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, MetricsHandler, generate_latest, start_http_server
+)
+
+# Pipeline stages, in order:
+#   received    upload arrived at the receiver
+#   transcoded  audio decoded to 16kHz and queued
+#   dequeued    claimed by a transcriber
+#   asr_done    Whisper transcript ready
+#   translated  NLLB translation ready
+#   merged      merged into a transcript line and published
+#   pushed      sent to a WebSocket client (observed once per client)
+STAGES = ("received", "transcoded", "dequeued", "asr_done", "translated", "merged", "pushed")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "translator_stage_seconds", "Time a clip spent reaching this stage from the previous one",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+END_TO_END_SECONDS = Histogram(
+    "translator_end_to_end_seconds", "Time from upload received to the line being pushed to a client",
+    buckets=LATENCY_BUCKETS
+)
+FIRST_PARTIAL_SECONDS = Histogram(
+    "translator_first_partial_seconds", "Time from upload received to its first streamed partial transcript",
+    buckets=LATENCY_BUCKETS
+)
+MODEL_SECONDS = Histogram(
+    "translator_model_seconds", "Time spent inside model calls", ["model"], buckets=LATENCY_BUCKETS
+)
+BATCH_SECONDS = Histogram(
+    "translator_batch_seconds", "Time to process one transcriber batch or merger tick",
+    ["service"], buckets=LATENCY_BUCKETS
+)
+QUEUE_DEPTH = Gauge("translator_queue_depth", "Items waiting in a Redis queue", ["queue"])
+PROCESSED_TOTAL = Counter("translator_processed_total", "Clips processed by a service", ["service"])
+
+def _observe_stage(timings, stage, now):
+    '''Observe the time since the latest stage before `stage` that was stamped.'''
+    for previous in reversed(STAGES[:STAGES.index(stage)]):
+        if previous in timings:
+            STAGE_SECONDS.labels(stage).observe(max(0.0, now - timings[previous]))
+            return
+
+def new_timings():
+    '''Start the timings of a freshly received clip.'''
+    return {"received": time.time()}
+
+def mark(timings, stage):
+    '''Stamp `stage` on a clip's timings and observe the time since the previous stage.
+
+    Tolerates payloads queued before timings existed (`timings` is None).'''
+    if timings is None:
+        return
+    now = time.time()
+    _observe_stage(timings, stage, now)
+    timings[stage] = now
+
+def mark_first_partial(timings):
+    '''Stamp and observe a clip's first streamed partial; later partials are ignored.'''
+    if timings is None or "first_partial" in timings:
+        return
+    timings["first_partial"] = time.time()
+    if "received" in timings:
+        FIRST_PARTIAL_SECONDS.observe(max(0.0, timings["first_partial"] - timings["received"]))
+
+def observe_delivery(timings):
+    '''Observe the push stage and end-to-end latency of a line sent to one client.'''
+    if not timings:
+        return
+    now = time.time()
+    _observe_stage(timings, "pushed", now)
+    if "received" in timings:
+        END_TO_END_SECONDS.observe(max(0.0, now - timings["received"]))
+
+def model_timer(model):
+    '''Context manager timing one model call, e.g. `with model_timer("nllb"):`.'''
+    return MODEL_SECONDS.labels(model).time()
+
+def track_queue_depth(client, queue):
+    '''Report a queue's length at scrape time through a synchronous Redis client.'''
+    QUEUE_DEPTH.labels(queue).set_function(lambda: client.llen(queue))
+
+def serve_metrics(port, health=None):
+    '''Expose /metrics on its own port, for services without an HTTP server.
+
+    `health` is a callable returning (healthy, report); when given, /health
+    answers with the report as JSON and a 200 or 503 status.'''
+    if health is None:
+        start_http_server(port)
+        print(f"📈 Metrics on :{port}/metrics")
+        return
+
+    class Handler(MetricsHandler):
+        '''Prometheus handler that also answers /health.'''
+
+        def do_GET(self):
+            if urlparse(self.path).path != "/health":
+                return super().do_GET()
+            healthy, report = health()
+            body = json.dumps(report).encode("utf-8")
+            self.send_response(200 if healthy else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return None
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    print(f"📈 Metrics on :{port}/metrics, health on :{port}/health")
+
+def render_metrics():
+    '''Current metrics in the Prometheus text format, as (body, content type).'''
+    return generate_latest(), CONTENT_TYPE_LATEST
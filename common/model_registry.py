@@ -0,0 +1,86 @@
+'''Background model loading with readiness reporting.
+
+Services register each model with a loader. Loads run in parallel on
+background threads, so a worker can start on whatever it needs first while
+the rest finish. `health()` backs the /health endpoint served next to
+/metrics (see common/metrics.py).
+
+Models are fetched into MODEL_CACHE_DIR. Bake that directory into the image
+(or mount it) and set MODEL_LOCAL_ONLY=1 to start without touching the hub.
+'''
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from huggingface_hub import snapshot_download
+except ImportError:  # Only services that fetch Hugging Face models need it
+    snapshot_download = None
+
+MODEL_CACHE_DIR = os.getenv(
+    "MODEL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "two_way_translator")
+)
+LOCAL_FILES_ONLY = os.getenv("MODEL_LOCAL_ONLY", "0") == "1"
+
+def local_model_path(repo_id):
+    '''Local directory of a Hugging Face model, downloaded into MODEL_CACHE_DIR unless LOCAL_FILES_ONLY.'''
+    if os.path.isdir(repo_id):
+        return repo_id
+    return snapshot_download(repo_id, cache_dir=MODEL_CACHE_DIR, local_files_only=LOCAL_FILES_ONLY)
+
+class ModelRegistry:
+    '''Loads named models on background threads and tracks their state.
+
+    The service is healthy once every model in `required` is ready; the
+    others may still be loading.'''
+
+    def __init__(self, required=()):
+        self.required = set(required)
+        self.futures = {}
+        self.status = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(thread_name_prefix="model-load")
+
+    def load(self, name, loader):
+        '''Start loading a model in the background (once per name); returns its future.'''
+        with self.lock:
+            if name not in self.futures:
+                self.status[name] = {"state": "loading"}
+                self.futures[name] = self.executor.submit(self._run, name, loader)
+            return self.futures[name]
+
+    def _run(self, name, loader):
+        start = time.perf_counter()
+        print(f"⏳ Loading {name}...")
+        try:
+            model = loader()
+        except Exception as e:
+            self.status[name] = {"state": "failed", "error": str(e), "seconds": round(time.perf_counter() - start, 1)}
+            print(f"❌ Loading {name} failed: {e}")
+            raise
+        self.status[name] = {"state": "ready", "seconds": round(time.perf_counter() - start, 1)}
+        print(f"✅ {name} ready in {self.status[name]['seconds']}s")
+        return model
+
+    def is_ready(self, name):
+        '''Whether a model has finished loading.'''
+        return self.status.get(name, {}).get("state") == "ready"
+
+    def wait(self, name, timeout=None):
+        '''Block until a model has loaded and return it; re-raises a failed load.'''
+        return self.futures[name].result(timeout)
+
+    def raise_if_failed(self, name):
+        '''Re-raise a model's load error without waiting for a load in progress.'''
+        future = self.futures.get(name)
+        if future is not None and future.done():
+            future.result()
+
+    def health(self):
+        '''Returns (healthy, report) for the /health endpoint.'''
+        models = {name: dict(state) for name, state in self.status.items()}
+        failed = any(state["state"] == "failed" for state in models.values())
+        healthy = not failed and all(self.is_ready(name) for name in self.required)
+        status = "failed" if failed else "ready" if healthy else "starting"
+        return healthy, {"status": status, "models": models}
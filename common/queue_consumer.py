@@ -0,0 +1,161 @@
+'''Reliable Redis list consumer shared by the transcriber and merger workers.'''
+import os
+import socket
+import threading
+
+# Atomically move up to ARGV[1] items from the head of KEYS[1] onto KEYS[2]:
+# one round trip for a bulk claim instead of one LMOVE per item.
+CLAIM_MANY_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+
+class QueueConsumer:
+    '''Claims items from a Redis list with BLMOVE so workers wake as soon as work arrives.
+
+    Each claimed item is parked on a per-consumer processing list until it is
+    acknowledged. If the worker dies before acking, `recover` pushes the parked
+    items back onto the queue the next time a consumer with the same id starts,
+    which gives at-least-once delivery. Consumer ids must be unique per running
+    worker (set CONSUMER_ID when running several workers on one host).
+
+    Consumers that run `start_heartbeat` also advertise liveness with a key that
+    expires after `heartbeat_ttl` seconds. Any live consumer periodically hands
+    the processing lists of consumers whose heartbeat has lapsed back to the
+    queue, so claims held by a crashed host are redelivered without a restart.
+    '''
+
+    def __init__(self, client, queue, consumer_id=None, block_timeout=1.0, heartbeat_ttl=30):
+        self.client = client
+        self.queue = queue
+        self.consumer_id = consumer_id or os.getenv("CONSUMER_ID") or socket.gethostname()
+        self.processing = self.processing_key(self.consumer_id)
+        self.block_timeout = block_timeout
+        self.heartbeat_ttl = heartbeat_ttl
+        self._stop = threading.Event()
+        self._heartbeat_thread = None
+        self._claim_many = client.register_script(CLAIM_MANY_SCRIPT)
+
+    def processing_key(self, consumer_id):
+        '''Name of the processing list holding a consumer's unacknowledged claims.'''
+        return f"{self.queue}:processing:{consumer_id}"
+
+    def heartbeat_key(self, consumer_id):
+        '''Name of the expiring key that marks a consumer as alive.'''
+        return f"{self.queue}:heartbeat:{consumer_id}"
+
+    @property
+    def registry_key(self):
+        '''Set of consumer ids that have claimed from this queue.'''
+        return f"{self.queue}:consumers"
+
+    def recover(self):
+        '''Return items left on this consumer's processing list to the head of the queue.'''
+        return self._requeue(self.consumer_id)
+
+    def _requeue(self, consumer_id):
+        processing = self.processing_key(consumer_id)
+        count = 0
+        # Move newest-first onto the head so the original order is preserved.
+        while self.client.lmove(processing, self.queue, "RIGHT", "LEFT") is not None:
+            count += 1
+        if count:
+            print(f"♻️  Requeued {count} unacknowledged item(s) from {processing}")
+        return count
+
+    def requeue_stale(self):
+        '''Redeliver the claims of every registered consumer whose heartbeat has expired.'''
+        count = 0
+        for consumer_id in self.client.smembers(self.registry_key):
+            if isinstance(consumer_id, bytes):  # Clients that do not decode replies
+                consumer_id = consumer_id.decode()
+            if consumer_id == self.consumer_id or self.client.exists(self.heartbeat_key(consumer_id)):
+                continue
+            count += self._requeue(consumer_id)
+            self.client.srem(self.registry_key, consumer_id)
+        return count
+
+    def heartbeat(self):
+        '''Mark this consumer alive for another `heartbeat_ttl` seconds.'''
+        pipe = self.client.pipeline(transaction=False)
+        pipe.sadd(self.registry_key, self.consumer_id)
+        pipe.set(self.heartbeat_key(self.consumer_id), 1, ex=self.heartbeat_ttl)
+        pipe.execute()
+
+    def start_heartbeat(self):
+        '''Refresh the heartbeat and reap stale consumers from a background thread.
+
+        Runs independently of the work loop so a long-running item (a slow
+        decode on CPU) does not let the claim look abandoned.'''
+        self.heartbeat()
+        self._stop.clear()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        interval = max(1, self.heartbeat_ttl / 3)
+        while not self._stop.wait(interval):
+            try:
+                self.heartbeat()
+                self.requeue_stale()
+            except Exception as e:
+                print(f"⚠️ Heartbeat failed for {self.consumer_id}: {e}")
+
+    def stop(self):
+        '''Stop heartbeating, hand back unacknowledged claims and deregister.'''
+        self._stop.set()
+        if self._heartbeat_thread:
+            self._heartbeat_thread.join(timeout=1)
+        self.recover()
+        self.client.delete(self.heartbeat_key(self.consumer_id))
+        self.client.srem(self.registry_key, self.consumer_id)
+
+    def pop(self, timeout=None):
+        '''Block until an item arrives (or `timeout` seconds pass) and claim it.'''
+        timeout = self.block_timeout if timeout is None else timeout
+        return self.client.blmove(self.queue, self.processing, timeout, "LEFT", "RIGHT")
+
+    def pop_nowait(self):
+        '''Claim an item if one is waiting, without blocking.'''
+        return self.client.lmove(self.queue, self.processing, "LEFT", "RIGHT")
+
+    def claim_many(self, max_items):
+        '''Claim up to `max_items` waiting items in a single round trip.'''
+        if max_items <= 0:
+            return []
+        return self._claim_many(keys=[self.queue, self.processing], args=[max_items])
+
+    def drain(self, max_items, timeout=None):
+        '''Block for the first item, then claim whatever else is already waiting.
+
+        Costs two round trips however many items are waiting (keep `max_items`
+        in the low thousands; the claim script unpacks them onto the Lua stack).'''
+        first = self.pop(timeout)
+        if first is None:
+            return []
+        return [first] + self.claim_many(max_items - 1)
+
+    def ack(self, *items):
+        '''Drop processed items from the processing list.'''
+        if not items:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for item in items:
+            pipe.lrem(self.processing, 1, item)
+        pipe.execute()
+
+    def release(self, *items):
+        '''Hand claimed items back to the head of the queue, unprocessed and in their order.'''
+        if not items:
+            return
+        # One transaction, so an item is never on both lists or on neither
+        pipe = self.client.pipeline(transaction=True)
+        for item in items:
+            pipe.lrem(self.processing, 1, item)
+        pipe.lpush(self.queue, *reversed(items))
+        pipe.execute()
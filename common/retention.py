@@ -0,0 +1,49 @@
+'''Bounded retention of per-room transcript state in Redis.
+
+Every write to a room refreshes ROOM_TTL_SECONDS on all of its keys, so an
+abandoned room expires as a whole instead of living forever. Finalized lines
+are compacted out of their per-line keys into one hash per room (see
+`final_lines`); only lines still being merged keep a key of their own, so
+the keyspace grows with open lines, not with history. The indexes keep
+referring to lines by their line key either way.
+
+The per-room seq counter outlives the rest (SEQ_TTL_SECONDS), so cursors of
+clients returning to a room stay valid. The helpers queue commands on a
+pipeline, so they work with both the sync and the asyncio Redis clients.
+'''
+import os
+
+from common.keys import final_lines, line_index, update_index, update_seq
+
+ROOM_TTL_SECONDS = int(os.getenv("ROOM_TTL_SECONDS", "86400"))  # 0 keeps rooms until cleared
+SEQ_TTL_SECONDS = int(os.getenv("SEQ_TTL_SECONDS", str(30 * 86400)))
+CLEAR_BATCH = 500  # Keys per UNLINK (or fields per HDEL/ZREM) when clearing or archiving
+
+def room_keys(room_id):
+    '''A room's index and compacted-line keys (not its open lines or seq counter).'''
+    return [line_index(room_id), update_index(room_id), final_lines(room_id)]
+
+def queue_line_write(pipe, room_id, key, value, final):
+    '''Queue the write of one line: open lines keep their own key, final lines move into the room hash.'''
+    if final:
+        pipe.hset(final_lines(room_id), key, value)
+        pipe.unlink(key)
+    else:
+        pipe.set(key, value, ex=ROOM_TTL_SECONDS or None)
+
+def queue_ttl_refresh(pipe, room_id):
+    '''Queue pushing back the expiry of everything a room keeps.'''
+    if not ROOM_TTL_SECONDS:
+        return
+    for key in room_keys(room_id):
+        pipe.expire(key, ROOM_TTL_SECONDS)
+    pipe.expire(update_seq(room_id), max(SEQ_TTL_SECONDS, ROOM_TTL_SECONDS))
+
+def queue_line_reads(pipe, room_id, keys):
+    '''Queue reading lines by key from both places a line can live; pass the two results to `pick_lines`.'''
+    pipe.mget(keys)
+    pipe.hmget(final_lines(room_id), keys)
+
+def pick_lines(open_values, final_values):
+    '''Each line's value from whichever of its open key or the room hash holds it (None if expired).'''
+    return [open_value or final_value for open_value, final_value in zip(open_values, final_values)]
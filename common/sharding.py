@@ -0,0 +1,48 @@
+'''Consistent-hash assignment of rooms to merger nodes.'''
+import bisect
+import hashlib
+import os
+
+from common.keys import unmerged_queue
+
+class HashRing:
+    '''Maps keys onto nodes so adding or removing a node only moves ~1/N of the keys.'''
+
+    def __init__(self, nodes, replicas=100):
+        self.nodes = list(nodes)
+        self._ring = sorted(
+            (self._hash(f"{node}#{replica}"), node)
+            for node in self.nodes
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+    def node_for(self, key):
+        '''Node owning `key`, or None on an empty ring.'''
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+def merger_ring():
+    '''Ring of merger nodes from MERGER_NODES (comma separated); empty means one unsharded merger.'''
+    nodes = [node.strip() for node in os.getenv("MERGER_NODES", "").split(",") if node.strip()]
+    return HashRing(nodes)
+
+def unmerged_queue_for_room(ring, room_id):
+    '''Unmerged queue of the merger node that owns `room_id`.'''
+    return unmerged_queue(ring.node_for(room_id))
+
+def check_merger_node(ring, node):
+    '''Raise ValueError unless `node` is on the ring (or both are unset), since no room would reach it.'''
+    if node is None and not ring.nodes:
+        return
+    if node is None:
+        raise ValueError(f"MERGER_NODE is unset but MERGER_NODES is {','.join(ring.nodes)}; no room would reach it")
+    if node not in ring.nodes:
+        configured = ",".join(ring.nodes) or "unset"
+        raise ValueError(f"MERGER_NODE {node!r} is not in MERGER_NODES ({configured}); no room would reach it")
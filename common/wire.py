@@ -0,0 +1,90 @@
+'''Versioned wire format for payloads passed between services.
+
+Every hop (translator:queue, translator:unmerged, stored lines, update
+channels and WebSocket frames) carries one of the message kinds in FIELDS.
+Two encodings exist:
+
+  json     a JSON object with field names, as the services have always sent
+  msgpack  msgpack `[version, kind, [values...], {extra fields}]`: field names
+           are implied by the schema, so they are not repeated in every message
+
+`loads` recognises either, so readers accept both while writers switch over.
+Set WIRE_FORMAT=msgpack once every service runs this module. Absent fields
+and None are the same on the wire. Fields outside the schema still
+round-trip through the extras map, so a new field can ship before the schema
+learns it.
+
+Changing a kind's field list means bumping WIRE_VERSION and keeping the old
+list in SCHEMAS, so messages already queued still decode.
+'''
+import json
+import os
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; without it everything stays JSON
+    msgpack = None
+
+WIRE_VERSION = 1
+
+# Field order per message kind, per schema version
+SCHEMAS = {
+    1: {
+        # A transcoded upload waiting for a transcriber
+        "clip": (
+            "room_id", "speaker_id", "timestamp", "prim_lang", "fall_lang", "audio_key", "filename",
+            "sample_rate", "sample_format", "trim_start_ms", "trim_end_ms", "duration_ms", "timings",
+        ),
+        # A transcribed (and translated, unless partial) clip waiting for a merger
+        "blerb": (
+            "room_id", "speaker_id", "start_timestamp", "duration_ms", "trim_end_ms", "clip_id", "partial",
+            "text", "text_error", "translation", "translation_error", "language", "raw_language",
+            "language_confidence", "timings",
+        ),
+        # A merged transcript line, as stored and published
+        "line": (
+            "room_id", "speaker_id", "start_timestamp", "seq", "partial", "final", "text", "text_error",
+            "translation", "translation_error", "language", "raw_language", "language_confidence", "timings",
+        ),
+        # Text appended to a line a WebSocket client already has (see websocket.py)
+        "delta": (
+            "type", "speaker_id", "start_timestamp", "seq", "base_seq", "partial", "final",
+            "text_append", "translation_append",
+        ),
+    },
+}
+FIELDS = SCHEMAS[WIRE_VERSION]
+
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json")
+if WIRE_FORMAT == "msgpack" and msgpack is None:
+    print("⚠️ WIRE_FORMAT=msgpack but msgpack is not installed; sending JSON")
+    WIRE_FORMAT = "json"
+
+def pack(kind, message):
+    '''msgpack encoding of a message of `kind`.'''
+    fields = FIELDS[kind]
+    extras = {key: value for key, value in message.items() if key not in fields and value is not None}
+    return msgpack.packb([WIRE_VERSION, kind, [message.get(field) for field in fields], extras])
+
+def dumps(kind, message, wire_format=None):
+    '''Encode a message of `kind` in `wire_format` (default WIRE_FORMAT): str for JSON, bytes for msgpack.'''
+    if (wire_format or WIRE_FORMAT) == "msgpack":
+        return pack(kind, message)
+    return json.dumps(message)
+
+def loads(data):
+    '''Decode a message in either encoding (str or bytes) to a dict; raises ValueError if it is neither.'''
+    if isinstance(data, str):
+        return json.loads(data)
+    if data[:1] in (b"{", b"["):
+        return json.loads(data)
+    if msgpack is None:
+        raise ValueError("Received a msgpack message but msgpack is not installed")
+    try:
+        version, kind, values, extras = msgpack.unpackb(data)
+        fields = SCHEMAS[version][kind]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Not a wire message: {e!r}") from e
+    message = {field: value for field, value in zip(fields, values) if value is not None}
+    message.update(extras)
+    return message
@@ -12,7 +12,7 @@ export default function Recorder() {
   const [recording, setRecording] = createSignal(false);
   const RECORDING_DURATION = 5000;
   const OVERLAP_TIME = 100; // ms
-  const { speakerId, primLang, fallLang } = useApp();
+  const { speakerId, primLang, fallLang, room } = useApp();
 
 
   let stream;
@@ -43,6 +43,7 @@ export default function Recorder() {
     formData.append("speaker_id", speakerId);
     formData.append("prim_lang", primLang());
     formData.append("fall_lang", fallLang());
+    formData.append("room_id", room());
     formData.append("recording_start_time", recordingStartTime);
     formData.append("timestamp", Date.now());
 
@@ -6,6 +6,7 @@ import languages from "@utils/languages.json"; // or relative path if no alias
 import './feed.css'
 
 import Message from '@components/message/Message';
+import { useApp } from "@context/AppContext";
 
 export default function Feed() {
     dayjs.extend(relativeTime);
@@ -13,15 +14,56 @@ export default function Feed() {
     const [lines, setLines] = createSignal([]);
     const [primLang, setPrimLang] = createSignal("");
     const [fallLang, setFallLang] = createSignal("");
+    const { room } = useApp();
     let socket;
     let transcriptLogRef;
+    let cursor = 0; // highest line seq seen, so reconnects only fetch what was missed
+    let reconnectTimer;
+    let closedByUser = false;
+
+    const isSameLine = (line, incoming) =>
+        line.speaker_id === incoming.speaker_id &&
+        line.start_timestamp === incoming.start_timestamp;
+
+    // A delta only appends to the version of the line it was computed from
+    const applyDelta = (prev, delta) => {
+        const index = prev.findIndex(line => isSameLine(line, delta));
+        if (index === -1 || prev[index].seq !== delta.base_seq) return null;
+        const updated = [...prev];
+        updated[index] = {
+            ...prev[index],
+            text: (prev[index].text ?? "") + delta.text_append,
+            translation: (prev[index].translation ?? "") + delta.translation_append,
+            seq: delta.seq,
+            partial: delta.partial,
+            final: delta.final
+        };
+        return updated;
+    };
 
-    onMount(() => {
-        socket = new WebSocket("ws://localhost:8006/ws/transcript");
+    const connect = () => {
+        socket = new WebSocket(
+            `ws://localhost:8006/ws/transcript?room=${encodeURIComponent(room())}&cursor=${cursor}&deltas=1`
+        );
 
         socket.onmessage = (event) => {
             const incoming = JSON.parse(event.data);
 
+            if (incoming.type === "delta") {
+                const updated = applyDelta(lines(), incoming);
+                if (!updated) {
+                    // Missed the version it builds on: reconnect and catch up from there
+                    cursor = Math.min(cursor, incoming.base_seq);
+                    socket.close();
+                    return;
+                }
+                if (incoming.seq > cursor) cursor = incoming.seq;
+                setLines(updated);
+                return;
+            }
+
+            if (incoming.seq > cursor) cursor = incoming.seq;
+
             if (!transcriptLogRef) return;
 
             const isAtBottom =
@@ -29,10 +71,7 @@ export default function Feed() {
                 transcriptLogRef.clientHeight + 10; // small padding
 
             setLines(prev => {
-                const index = prev.findIndex(line =>
-                    line.speaker_id === incoming.speaker_id &&
-                    line.start_timestamp === incoming.start_timestamp
-                );
+                const index = prev.findIndex(line => isSameLine(line, incoming));
 
                 if (index !== -1) {
                     const updated = [...prev];
@@ -63,14 +102,19 @@ export default function Feed() {
                 reason: event.reason,
                 wasClean: event.wasClean
             });
+            if (!closedByUser) reconnectTimer = setTimeout(connect, 1000);
         };
 
         socket.onerror = (err) => {
             console.error("⚠️ WebSocket error:", err);
         };
-    });
+    };
+
+    onMount(connect);
 
     onCleanup(() => {
+        closedByUser = true;
+        clearTimeout(reconnectTimer);
         socket?.close();
     });
 
@@ -83,7 +127,7 @@ export default function Feed() {
                 <Show when={lines().length === 0} fallback={
                     <For each={lines()}>
                         {(line) => (
-                            <div class="transcript-line">
+                            <div class="transcript-line" classList={{ partial: line.partial }}>
                                 <Message line={line} />
                             </div>
                         )}
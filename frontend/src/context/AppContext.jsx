@@ -6,12 +6,17 @@ export function AppProvider(props) {
   const [primLang, setPrimLang] = createSignal('en');
   const [fallLang, setFallLang] = createSignal();
   const [user, setUser] = createSignal({name: "Guest", id:1});
+  // Conversations are kept apart by room; share a link with ?room=<id> to join one
+  const [room, setRoom] = createSignal(
+    new URLSearchParams(window.location.search).get("room") || "default"
+  );
 
   return (
     <AppContext.Provider value={{
       primLang, setPrimLang,
       fallLang, setFallLang,
       user, setUser,
+      room, setRoom,
     }}>
       {props.children}
     </AppContext.Provider>
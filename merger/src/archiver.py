@@ -0,0 +1,148 @@
+"""archiver.py
+
+Moves finalized lines of idle rooms out of Redis into compressed files on the
+shared volume, so long-running deployments keep a flat Redis footprint without
+losing history. A room is idle once its newest line started more than
+ARCHIVE_IDLE_SECONDS ago. Its final lines are appended to
+`{SHARED_VOLUME_PATH}/archive/{room}/{first}-{last}.jsonl.gz` (or `.parquet`
+with ARCHIVE_FORMAT=parquet and pyarrow installed) and then removed from the
+room's hash and indexes. Lines still open are left alone.
+
+Run one archiver per deployment (`python src/archiver.py`, or `--once` from
+cron); a per-room lock keeps concurrent runs from archiving a room twice.
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+import redis
+from prometheus_client import Counter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.keys import INDEX_PREFIX, final_lines, line_index, update_index
+from common.retention import CLEAR_BATCH
+from common import wire
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet output is optional; gzip JSONL needs nothing extra
+    pyarrow = None
+
+redis_client = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+# Stored lines may be msgpack (see common/wire.py), so they are read undecoded
+redis_binary = redis.Redis(host="localhost", port=6379, db=0, decode_responses=False)
+
+SHARED_VOLUME_PATH = os.getenv("SHARED_VOLUME_PATH", "/shared_volume")
+ARCHIVE_DIR = os.path.join(SHARED_VOLUME_PATH, "archive")
+ARCHIVE_FORMAT = os.getenv("ARCHIVE_FORMAT", "jsonl")  # "jsonl" (gzip) or "parquet"
+ARCHIVE_IDLE_SECONDS = int(os.getenv("ARCHIVE_IDLE_SECONDS", "3600"))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "300"))
+LOCK_SECONDS = 600
+
+ARCHIVED_LINES = Counter("translator_archived_lines_total", "Final lines moved from Redis to the archive")
+ARCHIVED_ROOMS = Counter("translator_archived_rooms_total", "Idle rooms archived")
+
+def archive_lock(room_id):
+    '''Key held while a room is being archived.'''
+    return f"{INDEX_PREFIX}:{room_id}:archiving"
+
+def idle_rooms(now_ms):
+    '''Rooms whose newest line started more than ARCHIVE_IDLE_SECONDS before `now_ms`.'''
+    suffix = ":lines"
+    rooms = [
+        key[len(INDEX_PREFIX) + 1:-len(suffix)]
+        for key in redis_client.scan_iter(f"{INDEX_PREFIX}:*{suffix}", count=CLEAR_BATCH)
+    ]
+    if not rooms:
+        return []
+    pipe = redis_client.pipeline(transaction=False)
+    for room_id in rooms:
+        pipe.zrange(line_index(room_id), -1, -1, withscores=True)
+    newest = pipe.execute()
+    cutoff = now_ms - ARCHIVE_IDLE_SECONDS * 1000
+    return [room_id for room_id, last in zip(rooms, newest) if last and last[0][1] < cutoff]
+
+def read_final_lines(room_id):
+    '''A room's final lines in start order, as (line key, value) pairs, paging through its index.'''
+    lines = []
+    offset = 0
+    while True:
+        keys = redis_client.zrange(line_index(room_id), offset, offset + CLEAR_BATCH - 1)
+        if not keys:
+            return lines
+        values = redis_binary.hmget(final_lines(room_id), keys)
+        lines.extend((key, value) for key, value in zip(keys, values) if value)
+        offset += len(keys)
+
+def archive_path(room_id, lines):
+    '''Archive file for a room's lines, named by their first and last start timestamps.'''
+    first, last = lines[0]["start_timestamp"], lines[-1]["start_timestamp"]
+    directory = os.path.join(ARCHIVE_DIR, re.sub(r"[^\w.-]", "_", room_id))
+    os.makedirs(directory, exist_ok=True)
+    extension = "parquet" if ARCHIVE_FORMAT == "parquet" else "jsonl.gz"
+    return os.path.join(directory, f"{first}-{last}.{extension}")
+
+def write_archive(room_id, lines):
+    '''Write parsed lines to a new archive file; returns its path.'''
+    path = archive_path(room_id, lines)
+    if ARCHIVE_FORMAT == "parquet":
+        if pyarrow is None:
+            raise RuntimeError("ARCHIVE_FORMAT=parquet needs pyarrow installed")
+        pyarrow.parquet.write_table(pyarrow.Table.from_pylist(lines), path, compression="zstd")
+    else:
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return path
+
+def remove_lines(room_id, keys):
+    '''Drop archived lines from the room's hash and indexes, in batches.'''
+    for offset in range(0, len(keys), CLEAR_BATCH):
+        batch = keys[offset:offset + CLEAR_BATCH]
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hdel(final_lines(room_id), *batch)
+        pipe.zrem(line_index(room_id), *batch)
+        pipe.zrem(update_index(room_id), *batch)
+        pipe.execute()
+
+def archive_room(room_id):
+    '''Archive one room's final lines and remove them from Redis; returns how many were archived.'''
+    if not redis_client.set(archive_lock(room_id), "1", nx=True, ex=LOCK_SECONDS):
+        return 0
+    try:
+        pairs = read_final_lines(room_id)
+        if not pairs:
+            return 0
+        path = write_archive(room_id, [wire.loads(value) for _, value in pairs])
+        # Only remove what was written, so a line added meanwhile stays in Redis
+        remove_lines(room_id, [key for key, _ in pairs])
+        ARCHIVED_LINES.inc(len(pairs))
+        ARCHIVED_ROOMS.inc()
+        print(f"🗄️  Archived {len(pairs)} line(s) of {room_id} to {path}")
+        return len(pairs)
+    finally:
+        redis_client.unlink(archive_lock(room_id))
+
+def archive_idle_rooms():
+    '''Archive every idle room; returns the number of lines archived.'''
+    return sum(archive_room(room_id) for room_id in idle_rooms(int(time.time() * 1000)))
+
+def run_archiver():
+    '''Archive idle rooms every ARCHIVE_INTERVAL_SECONDS until interrupted.'''
+    print(f"🗄️  Archiving rooms idle for {ARCHIVE_IDLE_SECONDS}s to {ARCHIVE_DIR} ({ARCHIVE_FORMAT})")
+    while True:
+        archive_idle_rooms()
+        time.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive idle rooms' final transcript lines")
+    parser.add_argument("--once", action="store_true", help="archive idle rooms once and exit")
+    args = parser.parse_args()
+    if args.once:
+        archive_idle_rooms()
+    else:
+        run_archiver()
@@ -11,15 +11,32 @@ from transformers import MT5ForConditionalGeneration, MT5Tokenizer
 # ------------------- THIS IS NO LONGER USED ... RETAINED FOR FUTURE REFERENCE-------------------
 
 
-tokenizer = MT5Tokenizer.from_pretrained("google/mt5-small")
-model = MT5ForConditionalGeneration.from_pretrained("google/mt5-small") 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.model_registry import ModelRegistry, local_model_path
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
+
+# mT5 loads on a background thread the first time it is needed (or when
+# load_cleaner() is called at startup), so importing this module is cheap.
+cleaner_models = ModelRegistry()
+
+def load_mt5():
+    '''Load the mT5 cleaner from MODEL_CACHE_DIR.'''
+    model_path = local_model_path("google/mt5-small")
+    mt5_tokenizer = MT5Tokenizer.from_pretrained(model_path)
+    mt5_model = MT5ForConditionalGeneration.from_pretrained(model_path)
+    mt5_model.to(device)
+    return mt5_tokenizer, mt5_model
+
+def load_cleaner():
+    '''Start loading mT5 in the background; returns immediately.'''
+    return cleaner_models.load("mt5", load_mt5)
 
 def clean_text(text: str, mode: str = "transcription") -> str:
     print(f"Start Clean Text: text: {text}\nMode:{mode}")
     global cleaned
+    load_cleaner()
+    tokenizer, model = cleaner_models.wait("mt5")
     if mode == "transcription":
         if not text.strip():
             return ""
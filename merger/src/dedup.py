@@ -0,0 +1,132 @@
+'''Removes words repeated across the boundary of consecutive clips.
+
+The recorder's two MediaRecorders overlap by OVERLAP_TIME, so the words
+spoken in that overlap are transcribed at the end of one clip and again at
+the start of the next. When a thread's parts are joined, the longest run of
+tokens that ends one part and starts the next is dropped from the later part.
+
+How many tokens may be dropped depends on how much audio the two clips share.
+The upload `timestamp` is when a clip ended. When the receiver gated the clip,
+`duration_ms` and `trim_end_ms` locate its speech; without them the clip is
+assumed to span one recorder clip (DEDUP_CLIP_INTERVAL_MS plus
+DEDUP_CLIP_OVERLAP_MS) before its timestamp. Only a clip without a timestamp
+gets the full DEDUP_MAX_TOKENS. A single repeated token is dropped only when
+the gated clips measurably overlap, so a speaker saying "no." twice keeps
+both. Where the transcripts repeat, their translations are deduplicated the
+same way, which catches boundary words that translate identically.
+'''
+import math
+import os
+import re
+from prometheus_client import Counter
+
+DEDUP_MAX_TOKENS = int(os.getenv("DEDUP_MAX_TOKENS", "6"))      # Never drop more than this per boundary
+DEDUP_SLACK_MS = int(os.getenv("DEDUP_SLACK_MS", "300"))        # Allowance for client clock and upload jitter
+DEDUP_MIN_TOKENS = int(os.getenv("DEDUP_MIN_TOKENS", "2"))      # Shorter repeats need a measured overlap
+CLIP_INTERVAL_MS = int(os.getenv("DEDUP_CLIP_INTERVAL_MS", "5000"))  # Recorder.jsx RECORDING_DURATION
+CLIP_OVERLAP_MS = int(os.getenv("DEDUP_CLIP_OVERLAP_MS", "100"))  # Recorder.jsx OVERLAP_TIME
+WORDS_PER_SECOND = float(os.getenv("DEDUP_WORDS_PER_SECOND", "3.5"))  # Fast speech, to bound tokens in the overlap
+
+NON_WORD = re.compile(r"[^\w']")
+
+DEDUP_TOKENS = Counter(
+    "translator_dedup_tokens_total", "Tokens dropped as repeats across clip boundaries", ["field"]
+)
+DEDUP_BOUNDARIES = Counter("translator_dedup_boundaries_total", "Clip boundaries where repeated tokens were dropped")
+DEDUP_OVERLAP_SECONDS = Counter(
+    "translator_dedup_overlap_seconds_total", "Audio shared by consecutive clips where repeated tokens were dropped"
+)
+
+def normalize_token(token):
+    '''Token form used for matching: case and punctuation ignored.'''
+    return NON_WORD.sub("", token.casefold())
+
+def gated(blerb):
+    '''Whether the receiver located the clip's speech.'''
+    return blerb.get("duration_ms") is not None
+
+def speech_window(blerb):
+    '''(start, end) wall-clock ms of a clip's speech (its whole recording if not gated), or None without a timestamp.'''
+    if blerb.get("start_timestamp") is None:
+        return None
+    if not gated(blerb):
+        return blerb["start_timestamp"] - CLIP_INTERVAL_MS - CLIP_OVERLAP_MS, blerb["start_timestamp"]
+    end = blerb["start_timestamp"] - (blerb.get("trim_end_ms") or 0)
+    return end - blerb["duration_ms"], end
+
+def overlap_ms(previous, following):
+    '''Milliseconds of audio two consecutive clips share (negative for a gap); None when unknown.'''
+    before, after = speech_window(previous), speech_window(following)
+    if before is None or after is None:
+        return None
+    return before[1] - after[0]
+
+def token_budget(overlap):
+    '''How many boundary tokens may be repeats, given the clips' audio overlap.'''
+    if overlap is None:
+        return DEDUP_MAX_TOKENS
+    if overlap + DEDUP_SLACK_MS <= 0:
+        return 0
+    # One extra token for a word cut in half at either clip edge
+    return min(DEDUP_MAX_TOKENS, math.ceil((overlap + DEDUP_SLACK_MS) / 1000 * WORDS_PER_SECOND) + 1)
+
+def new_part(part_id, blerb):
+    '''A thread part for `blerb`, with the tokens its boundaries are matched on split and normalized once.'''
+    part = {"id": part_id, "blerb": blerb}
+    for field in ("text", "translation"):
+        words = blerb[field].split()
+        part[f"{field}_words"] = words
+        part[f"{field}_head"] = [normalize_token(token) for token in words[:DEDUP_MAX_TOKENS]]
+        part[f"{field}_tail"] = [normalize_token(token) for token in words[max(0, len(words) - DEDUP_MAX_TOKENS):]]
+    return part
+
+def repeated_tokens(tail, head, limit):
+    '''Length of the longest run (up to `limit`) of normalized tokens ending `tail` and starting `head`.'''
+    tail = tail[max(0, len(tail) - limit):] if limit else []
+    head = head[:limit]
+    for length in range(min(len(tail), len(head)), 0, -1):
+        if tail[-length:] == head[:length] and any(head[:length]):
+            return length
+    return 0
+
+def droppable(repeats, overlap, measured):
+    '''`repeats` if that many boundary tokens may go; a short repeat needs a measured overlap.'''
+    if repeats < DEDUP_MIN_TOKENS and not (measured and overlap is not None and overlap > 0):
+        return 0
+    return repeats
+
+def drop_tokens(part, field, count):
+    '''A part's `field` without its first `count` whitespace-separated tokens.'''
+    return " ".join(part[f"{field}_words"][count:]) if count else part["blerb"][field]
+
+def dedup_part(previous, part, counted):
+    '''A part's (text, translation) without the tokens it repeats from the part before it.
+
+    Parts come from new_part, in audio order; `previous` is None for a line's
+    first part. A boundary is counted in the metrics once, when both its clips
+    are final; `counted` holds the pairs of part ids already counted.'''
+    current = part["blerb"]
+    if previous is None:
+        return current["text"], current["translation"]
+    before = previous["blerb"]
+    overlap = overlap_ms(before, current)
+    limit = token_budget(overlap)
+    measured = gated(before) and gated(current)
+    text_repeats = droppable(repeated_tokens(previous["text_tail"], part["text_head"], limit), overlap, measured)
+    # Only where the transcripts overlapped, so unrelated repeats (e.g. two failures) stay
+    translation_repeats = (
+        droppable(repeated_tokens(previous["translation_tail"], part["translation_head"], limit), overlap, measured)
+        if text_repeats else 0
+    )
+
+    final = not before.get("partial") and not current.get("partial")
+    boundary = (previous["id"], part["id"])
+    if final and (text_repeats or translation_repeats) and boundary not in counted:
+        counted.add(boundary)
+        DEDUP_TOKENS.labels("text").inc(text_repeats)
+        DEDUP_TOKENS.labels("translation").inc(translation_repeats)
+        DEDUP_BOUNDARIES.inc()
+        if overlap is not None:
+            DEDUP_OVERLAP_SECONDS.inc(max(0, overlap) / 1000)
+        print(f"✂️  Dropped {text_repeats} repeated token(s) at a clip boundary")
+    return drop_tokens(part, "text", text_repeats), drop_tokens(part, "translation", translation_repeats)
@@ -1,103 +1,289 @@
 """merger.py"""
 import asyncio
+import bisect
+import heapq
+import itertools
+import os
+import sys
 import time
-import json
 import redis
+from prometheus_client import Gauge
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.keys import (
+    DEFAULT_ROOM, line_index, line_key, unmerged_queue, update_index, update_seq, updates_channel
+)
+from common.metrics import BATCH_SECONDS, PROCESSED_TOTAL, mark, serve_metrics, track_queue_depth
+from common.queue_consumer import QueueConsumer
+from common.retention import queue_line_write, queue_ttl_refresh
+from common.sharding import check_merger_node, merger_ring
+from common import wire
+from dedup import dedup_part, new_part
 
 # Redis connection
 redis_client = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+# Blerbs may arrive as msgpack (see common/wire.py), so the queue is read undecoded
+redis_binary = redis.Redis(host="localhost", port=6379, db=0, decode_responses=False)
+
+# Rooms are sharded across merger nodes by consistent hashing (see common/sharding.py).
+# MERGER_NODE names this instance; leave it unset for a single unsharded merger.
+MERGER_NODE = os.getenv("MERGER_NODE") or None
+unmerged_consumer = QueueConsumer(redis_binary, unmerged_queue(MERGER_NODE))
 
 MERGE_WINDOW_MS = 15000  # 15 seconds of silence to finalize a thread
+IDLE_BLOCK_SECONDS = 5  # How long to block on an empty queue with no open thread
+MAX_DRAIN = 1000  # Upper bound on blerbs claimed per tick
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9106"))
+
+# Open merge threads per room, keyed by (speaker_id, language). Several speakers
+# can hold open threads at once, so alternating speakers no longer cut each
+# other's lines short.
+room_threads = {}
+
+# Min-heap of (deadline, tie_breaker, room_id, thread_key). Each append pushes a
+# new deadline; entries whose deadline no longer matches the thread are stale
+# and skipped when popped.
+finalize_heap = []
+heap_counter = itertools.count()
 
-# Store current merging state
-merger_state = {
-    "current": None,
-    "last_merge_time": 0,
-    "base_timestamp": None
-}
+OPEN_THREADS = Gauge("translator_open_merge_threads", "Merge threads waiting for more blerbs")
+OPEN_THREADS.set_function(lambda: sum(len(threads) for threads in room_threads.values()))
 
-def get_unmerged_blerbs():
-    """""Accesses blerbs from Redis for merging."""
+def get_unmerged_blerbs(timeout):
+    """Blocks up to `timeout` seconds for blerbs, then claims everything waiting.
+
+    Returns the parsed blerbs and the raw items to acknowledge once merged."""
+    items = unmerged_consumer.drain(MAX_DRAIN, timeout)
     blerbs = []
-    while True:
-        item = redis_client.lpop("translator:unmerged")
-        if not item:
-            break
+    for item in items:
         try:
-            blerb = json.loads(item)
+            blerb = wire.loads(item)
             if "start_timestamp" in blerb and "speaker_id" in blerb and "text" in blerb and "translation" in blerb:
+                blerb.setdefault("room_id", DEFAULT_ROOM)
                 blerbs.append(blerb)
             else:
                 print("⚠️ Skipping invalid blerb:", blerb)
-        except json.JSONDecodeError:
+        except ValueError:
             print("⚠️ Could not decode blerb:", item)
-    return blerbs
-
-def update_merged_line(entry, timestamp, speaker_id):
-    '''Saves line to Redis using a stable key.'''
-    key = f"translator:transcription:{speaker_id}:{timestamp}"
-    # print(clean_text(entry["text"], "transcription"))
-    redis_client.set(key, json.dumps(entry))
-    merger_state["last_merge_time"] = time.time()
-
-def finalize_current_merge():
-    '''Finalize the current merge thread. So a new message can be started for the next speaker or language.'''
-    current = merger_state["current"]
-    if not current:
+    return blerbs, items
+
+def update_merged_lines(threads):
+    '''Saves the latest state of each changed line, indexes it and publishes it to WebSocket servers.
+
+    Costs two round trips however many lines changed: one to reserve a block of
+    `seq` values per room (clients use `seq` as a resume cursor) and one MULTI
+    carrying every write, ZADD, PUBLISH and TTL refresh. Final lines are
+    compacted into the room's hash (see common/retention.py).'''
+    if not threads:
         return
+    per_room = {}
+    for thread in threads:
+        per_room.setdefault(thread["entry"]["room_id"], []).append(thread)
+
+    pipe = redis_client.pipeline(transaction=False)
+    for room_id, room_lines in per_room.items():
+        pipe.incrby(update_seq(room_id), len(room_lines))
+    last_seqs = pipe.execute()
+
+    pipe = redis_client.pipeline()
+    for (room_id, room_lines), last_seq in zip(per_room.items(), last_seqs):
+        for seq, thread in enumerate(room_lines, start=last_seq - len(room_lines) + 1):
+            entry = thread["entry"]
+            key = line_key(room_id, entry["speaker_id"], thread["base_timestamp"])
+            # print(clean_text(entry["text"], "transcription"))
+            entry["seq"] = seq
+            value = wire.dumps("line", entry)
+            queue_line_write(pipe, room_id, key, value, entry.get("final"))
+            pipe.zadd(line_index(room_id), {key: thread["base_timestamp"]})
+            pipe.zadd(update_index(room_id), {key: seq})
+            pipe.publish(updates_channel(room_id), value)
+        queue_ttl_refresh(pipe, room_id)
+    pipe.execute()
+
+def schedule_finalize(room_id, thread_key, thread):
+    '''Push the thread's finalize deadline back by a full merge window.'''
+    thread["deadline"] = time.time() + MERGE_WINDOW_MS / 1000
+    heapq.heappush(finalize_heap, (thread["deadline"], next(heap_counter), room_id, thread_key))
+
+def finalize_thread(room_id, thread_key):
+    '''Close one merge thread so the next blerb from that speaker and language starts a new line.
+
+    Returns the closed thread, marked final, for the caller to write.'''
+    threads = room_threads.get(room_id, {})
+    thread = threads.pop(thread_key, None)
+    if not threads:
+        room_threads.pop(room_id, None)
+    if not thread:
+        return None
+
+    print(f"🔚 FINALIZING MERGE THREAD {thread_key} ({room_id})")
+    thread["entry"]["final"] = True
+    # Closing a line is not a new utterance, so its write carries no stage timings
+    thread["entry"].pop("timings", None)
+    return thread
 
-    print("🔚 FINALIZING MERGE THREAD")
-    update_merged_line(current, merger_state["base_timestamp"], current["speaker_id"])
+# Per-clip fields that describe a part, not the merged line
+CLIP_FIELDS = ("clip_id", "duration_ms", "trim_end_ms")
 
-    # Reset merger state
-    merger_state["current"] = None
-    merger_state["base_timestamp"] = None
-    merger_state["last_merge_time"] = time.time()
+def part_id(thread, blerb):
+    '''Which part of a thread a blerb fills: its clip, so a final replaces its partials.'''
+    return blerb.get("clip_id") or f"{blerb['start_timestamp']}:{len(thread['parts'])}"
+
+def find_part(thread, part):
+    '''Index of a part id in the thread's audio-ordered parts, or None.'''
+    timestamp = thread["part_timestamps"].get(part)
+    if timestamp is None:
+        return None
+    index = bisect.bisect_left(thread["timestamps"], timestamp)
+    while thread["parts"][index]["id"] != part:
+        index += 1
+    return index
+
+def rejoin(thread, first, last):
+    '''Deduplicate parts `first`..`last` against their predecessors and rebuild the line from `first` on.
+
+    Each part records where its text ends in the line, so the text before
+    `first` is reused as it stands.'''
+    parts, entry = thread["parts"], thread["entry"]
+    for index in range(first, min(last, len(parts) - 1) + 1):
+        previous = parts[index - 1] if index else None
+        parts[index]["text"], parts[index]["translation"] = dedup_part(previous, parts[index], thread["deduped"])
+    for field in ("text", "translation"):
+        end = parts[first - 1][f"{field}_end"] if first else 0
+        pieces = [entry[field][:end]] if end else []
+        for part in parts[first:]:
+            if part[field]:
+                end += len(part[field]) + (1 if end else 0)
+                pieces.append(part[field])
+            part[f"{field}_end"] = end
+        entry[field] = " ".join(pieces)
+
+def add_part(thread, blerb):
+    '''Insert or replace a clip's part of a thread, keeping parts in audio order, and update the line.
+
+    Words repeated where consecutive clips overlap are kept only once (see
+    dedup.py). Only the changed part and the one after it are deduplicated
+    again, and the line is rebuilt only from the changed part on.'''
+    parts, timestamps = thread["parts"], thread["timestamps"]
+    timestamp = blerb["start_timestamp"]
+    part = new_part(part_id(thread, blerb), blerb)
+    index = find_part(thread, part["id"])
+    if index is not None:
+        thread["partials"] -= bool(parts[index]["blerb"].get("partial"))
+    if index is not None and timestamps[index] == timestamp:
+        parts[index] = part
+        first, last = index, index + 1
+    else:
+        # A new part, or (rarely) a clip whose timestamp moved: everything after it is redone
+        first, last = len(parts), len(parts)
+        if index is not None:
+            del parts[index], timestamps[index]
+            first, last = index, len(parts)
+        index = bisect.bisect_right(timestamps, timestamp)
+        parts.insert(index, part)
+        timestamps.insert(index, timestamp)
+        first, last = min(first, index), max(last, index + 1)
+    thread["part_timestamps"][part["id"]] = timestamp
+    thread["partials"] += bool(blerb.get("partial"))
+    rejoin(thread, first, last)
+
+    entry = thread["entry"]
+    # Partial until every clip in the line has its final, translated result
+    entry["partial"] = thread["partials"] > 0
+    # The line's timings follow its newest blerb, so delivery measures that utterance
+    entry["timings"] = blerb.get("timings")
 
 def merge_blerbs(blerbs):
-    '''Merge new message into the current thread.'''
+    '''Merge new messages into their speaker's open thread, writing each changed line once.
+
+    Blerbs join a thread when their audio `start_timestamp` falls within
+    MERGE_WINDOW_MS of the thread's latest audio, regardless of when the
+    transcriber happened to deliver them. Streamed partials are forwarded as
+    soon as they arrive; a clip's later partials and its final result replace
+    its earlier text in place.'''
+    dirty = {}
     for blerb in sorted(blerbs, key=lambda x: x["start_timestamp"]):
-        current = merger_state["current"]
-        now = time.time()
-
-        if not current:
-            merger_state["current"] = blerb
-            merger_state["base_timestamp"] = blerb["start_timestamp"]
-            update_merged_line(blerb, merger_state["base_timestamp"], blerb["speaker_id"])
-            continue
-
-        time_since_last = (now - merger_state["last_merge_time"]) * 1000
-        same_speaker = blerb["speaker_id"] == current["speaker_id"]
-        same_language = blerb["language"] == current["language"]
-        close_in_time = time_since_last <= MERGE_WINDOW_MS
-
-        if same_speaker and same_language and close_in_time:
-            print(f"🔄 MERGING {blerb['start_timestamp']} → {merger_state['base_timestamp']}")
-            current["text"] += " " + blerb["text"]
-            current["translation"] += " " + blerb["translation"]
-            update_merged_line(current, merger_state["base_timestamp"], current["speaker_id"])
+        room_id = blerb["room_id"]
+        thread_key = (blerb["speaker_id"], blerb["language"])
+        thread = room_threads.get(room_id, {}).get(thread_key)
+        mark(blerb.get("timings"), "merged")
+
+        if thread and blerb["start_timestamp"] - thread["last_audio_ts"] <= MERGE_WINDOW_MS:
+            print(f"🔄 MERGING {blerb['start_timestamp']} → {thread['base_timestamp']}")
+            thread["last_audio_ts"] = max(thread["last_audio_ts"], blerb["start_timestamp"])
         else:
-            finalize_current_merge()
-            merger_state["current"] = blerb
-            merger_state["base_timestamp"] = blerb["start_timestamp"]
-            update_merged_line(blerb, merger_state["base_timestamp"], blerb["speaker_id"])
+            if thread:
+                closed = finalize_thread(room_id, thread_key)
+                dirty[id(closed)] = closed
+            thread = {
+                "entry": {key: value for key, value in blerb.items() if key not in CLIP_FIELDS},
+                "parts": [],  # From dedup.new_part, in audio order
+                "timestamps": [],  # Each part's start_timestamp, for bisecting
+                "part_timestamps": {},  # Part id -> its start_timestamp, to find a part to replace
+                "partials": 0,  # Parts still waiting for their final result
+                "deduped": set(),
+                "base_timestamp": blerb["start_timestamp"],
+                "last_audio_ts": blerb["start_timestamp"],
+            }
+            room_threads.setdefault(room_id, {})[thread_key] = thread
+
+        add_part(thread, blerb)
+
+        schedule_finalize(room_id, thread_key, thread)
+        # Keyed by identity so a thread closed mid-tick keeps its own final write
+        dirty[id(thread)] = thread
+
+    update_merged_lines(list(dirty.values()))
+
+def _drop_stale_timers():
+    '''Pop heap entries whose thread has since been extended or finalized.'''
+    while finalize_heap:
+        deadline, _, room_id, thread_key = finalize_heap[0]
+        thread = room_threads.get(room_id, {}).get(thread_key)
+        if thread and thread["deadline"] == deadline:
+            return
+        heapq.heappop(finalize_heap)
+
+def finalize_expired_threads():
+    """Finalizes every thread whose merge window has run out."""
+    now = time.time()
+    finalized = []
+    _drop_stale_timers()
+    while finalize_heap and finalize_heap[0][0] <= now:
+        _, _, room_id, thread_key = heapq.heappop(finalize_heap)
+        finalized.append(finalize_thread(room_id, thread_key))
+        _drop_stale_timers()
+    update_merged_lines(finalized)
+
+def next_block_timeout():
+    """Seconds to block for new blerbs before the next open thread is due to finalize."""
+    _drop_stale_timers()
+    if not finalize_heap:
+        return IDLE_BLOCK_SECONDS
+    return max(0.05, finalize_heap[0][0] - time.time())
 
 async def run_merger_loop():
     """Main loop for the merger service."""
-    print("🌀 Merger service running on key scan mode")
+    check_merger_node(merger_ring(), MERGER_NODE)
+    print(f"🌀 Merger service running on blocking queue mode ({unmerged_consumer.queue})")
+    unmerged_consumer.recover()
+    serve_metrics(METRICS_PORT)
+    track_queue_depth(redis_client, unmerged_consumer.queue)
 
     while True:
+        # Wakes as soon as a blerb arrives, or when the next thread's window runs out
+        blerbs, items = await asyncio.to_thread(get_unmerged_blerbs, next_block_timeout())
         start = time.perf_counter()
-        blerbs = get_unmerged_blerbs()
-        time_since_last_merge = (time.time() - merger_state["last_merge_time"]) * 1000
-        duration = round((time.perf_counter() - start) * 1000)
 
         if blerbs:
             merge_blerbs(blerbs)
-            print(f"⏱️  Merging took {duration}ms. Time since last merge: {time_since_last_merge:.2f}ms")
-        elif time_since_last_merge > MERGE_WINDOW_MS:
-            finalize_current_merge()
-        await asyncio.sleep(0.5)
+            BATCH_SECONDS.labels("merger").observe(time.perf_counter() - start)
+            PROCESSED_TOTAL.labels("merger").inc(len(blerbs))
+            duration = round((time.perf_counter() - start) * 1000)
+            rooms = len({blerb["room_id"] for blerb in blerbs})
+            print(f"⏱️  Merging {len(blerbs)} blerb(s) across {rooms} room(s) took {duration}ms")
+        finalize_expired_threads()
+        unmerged_consumer.ack(*items)
 
 if __name__ == "__main__":
     asyncio.run(run_merger_loop())
@@ -1,18 +1,47 @@
+import sys
 import time
 import json
 import redis
 
-# --------------------------- THIS WAS USED FOR EARLY TESTING ... RETAINED FOR FUTURE REFERENCE ---------------------------
+import merger
+from common.queue_consumer import QueueConsumer
+
+# Compares the original merge path (one LPOP per blerb to drain, one SET per merge
+# step) with the current merger (bulk claim, one pipelined write per changed line
+# per tick) on the same scenario, counting Redis round trips and wall time. Needs
+# a live Redis. Exits non-zero when the current path is slower than the legacy one,
+# so fewer round trips can't hide a regression in the merge itself.
 
 # Constants
 NUM_BLERBS = 1000
 MERGE_WINDOW_MS = 15000
 TEST_KEY_PREFIX = "translator:testing"
+TEST_QUEUE = f"{TEST_KEY_PREFIX}:unmerged"
+TEST_ROOM = "benchmark"
+
+class CountingRedis(redis.Redis):
+    """Redis client that counts round trips; a pipeline execute counts as one."""
+    round_trips = 0
+
+    def execute_command(self, *args, **options):
+        self.round_trips += 1
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        def counted_execute(raise_on_error=True):
+            self.round_trips += 1
+            return execute(raise_on_error)
+
+        pipe.execute = counted_execute
+        return pipe
 
 # Setup test Redis connection
-redis_client = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+redis_client = CountingRedis(host="localhost", port=6379, db=0, decode_responses=True)
 
-# Keep test merger state local
+# Keep legacy merger state local
 merger_state = {
     "current": None,
     "base_timestamp": None
@@ -23,9 +52,12 @@ def generate_test_blerbs():
     base = int(time.time() * 1000)
     return [
         {
+            "room_id": TEST_ROOM,
             "speaker_id": f"player_{i % 2 + 1}",
             "start_timestamp": base + (i % 20) * 1000,
-            "text": f"Test message {i}"
+            "text": f"Test message {i}",
+            "translation": f"Translated message {i}",
+            "language": "eng_Latn",
         }
         for i in range(NUM_BLERBS)
     ]
@@ -36,11 +68,22 @@ def update_cleaned_line(entry, key_timestamp):
 
 def clear_test_data():
     """Delete all keys used during test."""
-    for key in redis_client.keys(f"{TEST_KEY_PREFIX}:*"):
-        redis_client.delete(key)
+    for pattern in (f"{TEST_KEY_PREFIX}:*", f"translator:*:{TEST_ROOM}:*"):
+        for key in redis_client.scan_iter(pattern):
+            redis_client.unlink(key)
 
-def merge_blerbs(blerbs):
-    """Run the actual merging logic on the test data."""
+def legacy_drain():
+    """Drain the test queue one LPOP at a time, as the original merger did."""
+    blerbs = []
+    while True:
+        item = redis_client.lpop(TEST_QUEUE)
+        if not item:
+            break
+        blerbs.append(json.loads(item))
+    return blerbs
+
+def legacy_merge_blerbs(blerbs):
+    """Run the original merging logic: a SET for every merge step."""
     for blerb in blerbs:
         current = merger_state["current"]
         if not current:
@@ -61,17 +104,50 @@ def merge_blerbs(blerbs):
             merger_state["base_timestamp"] = blerb["start_timestamp"]
             update_cleaned_line(blerb, merger_state["base_timestamp"])
 
-# Run the benchmark
-if __name__ == "__main__":
-    blerbs = generate_test_blerbs()
+def run_scenario(name, drain_and_merge, blerbs):
+    """Queue the blerbs, then time and count one drain-and-merge pass.
 
+    Returns (round trips, wall time in ms)."""
+    redis_client.rpush(TEST_QUEUE, *(json.dumps(blerb) for blerb in blerbs))
+    redis_client.round_trips = 0
     start = time.perf_counter()
-    merge_blerbs(blerbs)
-    end = time.perf_counter()
-
-    print("\n--- Benchmark Results ---")
+    drain_and_merge()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"\n--- {name} ---")
     print(f"Processed: {NUM_BLERBS} blerbs")
-    print(f"Total time: {(end - start)*1000:.2f} ms")
-    print(f"Avg time per blerb: {((end - start)*1000) / NUM_BLERBS:.4f} ms")
+    print(f"Redis round trips: {redis_client.round_trips}")
+    print(f"Total time: {elapsed:.2f} ms")
+    print(f"Avg time per blerb: {elapsed / NUM_BLERBS:.4f} ms")
+    return redis_client.round_trips, elapsed
+
+def current_drain_and_merge():
+    """Claim everything in one bulk drain and merge it with the real merger."""
+    consumer = QueueConsumer(redis_client, TEST_QUEUE, consumer_id="benchmark")
+    items = consumer.drain(NUM_BLERBS, timeout=1)
+    merger.merge_blerbs([json.loads(item) for item in items])
+    consumer.ack(*items)
 
-    clear_test_data()
+# Run the benchmark
+if __name__ == "__main__":
+    merger.redis_client = redis_client
+    blerbs = generate_test_blerbs()
+    slower = False
+    try:
+        before_trips, before_ms = run_scenario(
+            "Before: LPOP drain + SET per merge",
+            lambda: legacy_merge_blerbs(legacy_drain()),
+            [dict(blerb) for blerb in blerbs]
+        )
+        after_trips, after_ms = run_scenario(
+            "After: bulk claim + pipelined tick writes",
+            current_drain_and_merge,
+            [dict(blerb) for blerb in blerbs]
+        )
+        print(f"\nRound trips: {before_trips} → {after_trips}")
+        print(f"Wall time: {before_ms:.2f} ms → {after_ms:.2f} ms")
+        slower = after_ms > before_ms
+        if slower:
+            print(f"❌ The current path is {after_ms / before_ms:.1f}x slower than the legacy path")
+    finally:
+        clear_test_data()
+    sys.exit(1 if slower else 0)
@@ -0,0 +1,28 @@
+'''In-process audio decoding for the zero-file upload path.'''
+import io
+
+try:
+    import av
+except ImportError:  # PyAV is optional; without it uploads go through ffmpeg on disk
+    av = None
+
+SAMPLE_RATE = 16000
+SAMPLE_FORMAT = "s16le"
+
+def pcm_available():
+    '''Whether uploads can be decoded in-process.'''
+    return av is not None
+
+def decode_to_pcm(data, sample_rate=SAMPLE_RATE):
+    '''Decode an uploaded clip to mono 16-bit little-endian PCM at `sample_rate`.'''
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+    chunks = []
+    with av.open(io.BytesIO(data), mode="r", metadata_errors="ignore") as container:
+        for frame in container.decode(audio=0):
+            frame.pts = None
+            for resampled in resampler.resample(frame):
+                chunks.append(resampled.to_ndarray().tobytes())
+        # Flush whatever the resampler is still buffering
+        for resampled in resampler.resample(None):
+            chunks.append(resampled.to_ndarray().tobytes())
+    return b"".join(chunks)
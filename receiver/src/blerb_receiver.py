@@ -1,15 +1,70 @@
 '''blerb_receiver.py'''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import redis
+import redis.asyncio as redis
 import uuid
 import os
-import json
+import sys
+import time
 import ffmpeg  # add this to your imports at the top
+from prometheus_client import Counter, Gauge
+from .audio import SAMPLE_FORMAT, SAMPLE_RATE, decode_to_pcm, pcm_available
+from .vad import VAD_BACKEND, VAD_ENABLED, backend_name, gate_pcm, gate_wav
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.admission import parse_level, record as record_admission
+from common.keys import ADMISSION_KEY, DEFAULT_ROOM, TRANSCRIBER_QUEUE
+from common.metrics import QUEUE_DEPTH, mark, new_timings, render_metrics
+from common import wire
 
-app = FastAPI()
+
+# ─── Transcode Pool Setup ────────────────────────────────────────────────────
+# Transcoding runs on a bounded thread pool so it never blocks the event loop
+# (ffmpeg runs as a subprocess and PyAV releases the GIL while decoding).
+# Uploads beyond TRANSCODE_WORKERS + TRANSCODE_BACKLOG in flight get a 429 so
+# clients back off instead of piling up behind slow transcodes.
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", str(os.cpu_count() or 1)))
+TRANSCODE_BACKLOG = int(os.getenv("TRANSCODE_BACKLOG", str(TRANSCODE_WORKERS * 2)))
+transcode_pool = ThreadPoolExecutor(max_workers=TRANSCODE_WORKERS, thread_name_prefix="transcode")
+transcode_state = {"in_flight": 0, "rejected": 0, "silent": 0}
+
+# ─── Admission Control ───────────────────────────────────────────────────────
+# The transcribers publish an admission level from the transcriber queue's
+# age (see common/admission.py). At "reject" uploads get a 503 instead of
+# joining a backlog they would be captioned minutes behind. The level is
+# re-read at most every ADMISSION_CACHE_SECONDS.
+ADMISSION_CACHE_SECONDS = float(os.getenv("ADMISSION_CACHE_SECONDS", "1"))
+ADMISSION_RETRY_AFTER = os.getenv("ADMISSION_RETRY_AFTER", "5")
+admission_state = {"level": "normal", "read_at": float("-inf"), "rejected": 0}
+
+async def admission_level():
+    '''The published admission level, cached for ADMISSION_CACHE_SECONDS.'''
+    now = time.monotonic()
+    if now - admission_state["read_at"] >= ADMISSION_CACHE_SECONDS:
+        admission_state["level"] = parse_level(await redis_client.get(ADMISSION_KEY))
+        admission_state["read_at"] = now
+    return admission_state["level"]
+
+# ─── Metrics Setup ───────────────────────────────────────────────────────────
+TRANSCODES_IN_FLIGHT = Gauge("translator_transcodes_in_flight", "Uploads transcoding or waiting for a pool slot")
+TRANSCODES_IN_FLIGHT.set_function(lambda: transcode_state["in_flight"])
+REJECTED_UPLOADS = Counter("translator_rejected_uploads_total", "Uploads rejected with a 429 by back-pressure")
+SILENT_CLIPS = Counter("translator_silent_clips_total", "Uploads dropped by voice activity gating before queueing")
+TRIMMED_SECONDS = Counter("translator_trimmed_audio_seconds_total", "Leading and trailing silence trimmed from queued clips")
+
+@asynccontextmanager
+async def lifespan(_app):
+    '''Release the transcode pool and Redis connections on shutdown.'''
+    yield
+    transcode_pool.shutdown(wait=True)
+    await redis_client.aclose()
+    await redis_binary.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,20 +75,165 @@ app.add_middleware(
 )
 
 redis_client = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+# Raw PCM payloads are binary, so they need a client that does not decode replies
+redis_binary = redis.Redis(host="localhost", port=6379, db=0, decode_responses=False)
 
 # ─── Shared Volume Setup ─────────────────────────────────────────────────────
 SHARED_VOLUME_PATH = os.getenv("SHARED_VOLUME_PATH", "/shared_volume")
 AUDIO_DIR = os.path.join(SHARED_VOLUME_PATH, "blerbs")
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
+# ─── Audio Transport Setup ───────────────────────────────────────────────────
+# "file" writes a 16kHz WAV to the shared volume (the original path).
+# "redis" decodes in-process and hands the transcriber raw PCM through Redis;
+# it falls back to "file" when PyAV is missing or a clip fails to decode.
+AUDIO_TRANSPORT = os.getenv("AUDIO_TRANSPORT", "file")
+AUDIO_TTL_SECONDS = int(os.getenv("AUDIO_TTL_SECONDS", "600"))
+
+# ─── Voice Activity Gating ───────────────────────────────────────────────────
+# Silent clips are dropped after decoding, before they reach the queue, and
+# the rest are trimmed to their speech (see vad.py). VAD_ENABLED=0 queues
+# every clip as uploaded.
+print(f"🎙️ Voice activity gating: {backend_name() if VAD_ENABLED else 'off'}")
+if VAD_ENABLED and backend_name() != VAD_BACKEND:
+    print(f"⚠️ VAD_BACKEND={VAD_BACKEND} is not available (is webrtcvad installed?); gating by energy instead")
+
+def count_gating(info):
+    '''Record a gating result; returns whether the clip was silent.'''
+    if not info:
+        return False
+    if "duration_ms" not in info:
+        transcode_state["silent"] += 1
+        SILENT_CLIPS.inc()
+        print(f"🔇 Dropping silent clip ({info['speech_ms']}ms of speech)")
+        return True
+    TRIMMED_SECONDS.inc((info["original_ms"] - info["duration_ms"]) / 1000)
+    return False
+
+def decode_and_gate(data):
+    '''Decode an upload to PCM and gate it; returns (pcm or None if silent, gating info).'''
+    pcm = decode_to_pcm(data, SAMPLE_RATE)
+    if not VAD_ENABLED:
+        return pcm, {}
+    return gate_pcm(pcm, SAMPLE_RATE)
+
+def clip_fields(info):
+    '''Payload fields describing a gated clip, so downstream can align trimmed audio.
+
+    The upload `timestamp` is when the clip ended, so its speech spans
+    `duration_ms` up to `trim_end_ms` before it.'''
+    return {field: info[field] for field in ("trim_start_ms", "trim_end_ms", "duration_ms") if field in info}
+
+def silent_response():
+    '''Upload accepted but not queued because nobody was speaking.'''
+    return JSONResponse({"status": "dropped", "reason": "silent"})
+
+async def run_in_pool(func, *args):
+    '''Run a blocking transcode step on the bounded pool.'''
+    return await asyncio.get_running_loop().run_in_executor(transcode_pool, func, *args)
+
+def transcode_file(data, raw_path, processed_path):
+    '''Write an upload to the shared volume and convert it to a 16kHz mono WAV.'''
+    with open(raw_path, "wb") as f:
+        f.write(data)
+    try:
+        ffmpeg.input(raw_path).output(
+            processed_path,
+            ar=16000,      # Set sample rate to 16kHz
+            ac=1,          # Set audio channels to mono
+            format='wav'   # Output format
+        ).overwrite_output().run(quiet=True)
+    finally:
+        os.remove(raw_path)  # Clean up original
+
+async def queue_pcm(data, room_id, speaker_id, timestamp, prim_lang, fall_lang, unique_id, timings):
+    '''Decode an upload in memory and queue its PCM without touching disk.
+
+    Returns the audio key, or None when the clip was dropped as silent.'''
+    pcm, gating = await run_in_pool(decode_and_gate, data)
+    if count_gating(gating):
+        mark(timings, "transcoded")
+        return None
+    audio_key = f"translator:audio:{speaker_id}_{timestamp}_{unique_id}"
+    # Expire unclaimed audio so a dead transcriber cannot leak memory
+    await redis_binary.set(audio_key, pcm, ex=AUDIO_TTL_SECONDS)
+    mark(timings, "transcoded")
+    await redis_client.rpush(TRANSCRIBER_QUEUE, wire.dumps("clip", {
+        "audio_key": audio_key,
+        "sample_rate": SAMPLE_RATE,
+        "sample_format": SAMPLE_FORMAT,
+        "room_id": room_id,
+        "speaker_id": speaker_id,
+        "timestamp": timestamp,
+        "prim_lang": prim_lang,
+        "fall_lang": fall_lang,
+        **clip_fields(gating),
+        "timings": timings
+    }))
+    return audio_key
+
+def transcode_capacity():
+    '''Maximum uploads that may be transcoding or waiting for a pool slot.'''
+    return TRANSCODE_WORKERS + TRANSCODE_BACKLOG
+
+@app.get("/stats")
+async def stats():
+    '''Reports transcode pool pressure and transcriber queue depth for capacity planning.'''
+    return {
+        "transcodes_in_flight": transcode_state["in_flight"],
+        "transcode_workers": TRANSCODE_WORKERS,
+        "transcode_capacity": transcode_capacity(),
+        "rejected_uploads": transcode_state["rejected"],
+        "admission_level": await admission_level(),
+        "admission_rejected_uploads": admission_state["rejected"],
+        "silent_clips_dropped": transcode_state["silent"],
+        "queue_depth": await redis_client.llen(TRANSCRIBER_QUEUE),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    '''Prometheus scrape endpoint: stage latencies, transcode pressure and queue depth.'''
+    QUEUE_DEPTH.labels(TRANSCRIBER_QUEUE).set(await redis_client.llen(TRANSCRIBER_QUEUE))
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
 @app.post("/upload-audio/")
 async def upload_audio(
     file: UploadFile = File(...),
     speaker_id: str = Form(...),
     timestamp: int = Form(...),
     prim_lang: str = Form(...),
-    fall_lang: str = Form(...)
+    fall_lang: str = Form(...),
+    room_id: str = Form(DEFAULT_ROOM)
 ):
+    if transcode_state["in_flight"] >= transcode_capacity():
+        transcode_state["rejected"] += 1
+        REJECTED_UPLOADS.inc()
+        print(f"⛔ Transcode pool saturated ({transcode_state['in_flight']} in flight), rejecting upload")
+        return JSONResponse(
+            {"error": "Receiver busy, retry shortly"},
+            status_code=429,
+            headers={"Retry-After": "1"}
+        )
+    if await admission_level() == "reject":
+        admission_state["rejected"] += 1
+        record_admission("rejected")
+        print("⛔ Transcriber backlog too old, rejecting upload")
+        return JSONResponse(
+            {"error": "Transcription backlog, retry later"},
+            status_code=503,
+            headers={"Retry-After": ADMISSION_RETRY_AFTER}
+        )
+
+    timings = new_timings()
+    transcode_state["in_flight"] += 1
+    try:
+        return await queue_upload(file, room_id, speaker_id, timestamp, prim_lang, fall_lang, timings)
+    finally:
+        transcode_state["in_flight"] -= 1
+
+async def queue_upload(file, room_id, speaker_id, timestamp, prim_lang, fall_lang, timings):
+    '''Transcode an upload off the event loop and push it onto the transcriber queue.'''
     extension = os.path.splitext(file.filename)[-1].lower()
     unique_id = uuid.uuid4().hex
 
@@ -41,29 +241,40 @@ async def upload_audio(
     raw_path = os.path.join(AUDIO_DIR, raw_filename)
 
     print(f"📥 Received file: {raw_filename}")
-    with open(raw_path, "wb") as f:
-        f.write(await file.read())
+    data = await file.read()
+
+    if AUDIO_TRANSPORT == "redis" and pcm_available():
+        try:
+            audio_key = await queue_pcm(
+                data, room_id, speaker_id, timestamp, prim_lang, fall_lang, unique_id, timings
+            )
+            if audio_key is None:
+                return silent_response()
+            return JSONResponse({"status": "queued", "audio_key": audio_key})
+        except Exception as e:
+            print(f"⚠️ In-memory decode failed, falling back to ffmpeg: {e}")
 
     # Convert to 16kHz WAV format
     processed_filename = f"{speaker_id}_{timestamp}_{unique_id}_processed.wav"
     processed_path = os.path.join(AUDIO_DIR, processed_filename)
     try:
-        ffmpeg.input(raw_path).output(
-            processed_path,
-            ar=16000,      # Set sample rate to 16kHz
-            ac=1,          # Set audio channels to mono
-            format='wav'   # Output format
-        ).overwrite_output().run(quiet=True)
-        os.remove(raw_path)  # Clean up original
+        await run_in_pool(transcode_file, data, raw_path, processed_path)
     except ffmpeg.Error as e:
         print(f"❌ FFmpeg error:\n{e.stderr.decode()}")
         return JSONResponse({"error": "Audio conversion failed"}, status_code=500)
+    gating = await run_in_pool(gate_wav, processed_path) if VAD_ENABLED else {}
+    mark(timings, "transcoded")
+    if count_gating(gating):
+        return silent_response()
 
-    redis_client.rpush("translator:queue", json.dumps({
+    await redis_client.rpush(TRANSCRIBER_QUEUE, wire.dumps("clip", {
         "filename": processed_filename,  # Just pass the filename instead of full path
+        "room_id": room_id,
         "speaker_id": speaker_id,
         "timestamp": timestamp,
         "prim_lang": prim_lang,
-        "fall_lang": fall_lang
+        "fall_lang": fall_lang,
+        **clip_fields(gating),
+        "timings": timings
     }))
     return JSONResponse({"status": "queued", "filename": processed_filename})
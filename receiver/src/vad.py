@@ -0,0 +1,92 @@
+'''Voice activity gating for decoded uploads.
+
+The recorder uploads overlapping clips on a fixed interval, whether anyone is
+speaking or not. Gating them here, right after decoding, drops silent clips
+before they cost a queue slot and a Whisper call, and trims leading and
+trailing silence from the rest.
+
+Frames are classified by WebRTC VAD when VAD_BACKEND is "webrtc" (the
+default; `webrtcvad` comes from the webrtcvad-wheels requirement), otherwise
+by RMS energy against VAD_ENERGY_DBFS. Without `webrtcvad` the energy gate
+is used, and the receiver says so at startup.
+'''
+import os
+import wave
+import numpy as np
+
+try:
+    import webrtcvad
+except ImportError:  # webrtcvad is optional; the energy gate needs only numpy
+    webrtcvad = None
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+VAD_BACKEND = os.getenv("VAD_BACKEND", "webrtc")            # "webrtc" or "energy"
+VAD_AGGRESSIVENESS = int(os.getenv("VAD_AGGRESSIVENESS", "2"))  # WebRTC mode, 0 (lenient) - 3 (strict)
+VAD_ENERGY_DBFS = float(os.getenv("VAD_ENERGY_DBFS", "-45"))    # Frames louder than this are speech
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "250"))  # Less speech than this and the clip is dropped
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))        # Silence kept around the speech when trimming
+
+FRAME_MS = 30  # One of the frame sizes WebRTC VAD accepts
+SAMPLE_WIDTH = 2  # 16-bit PCM
+
+def backend_name():
+    '''The frame classifier in use.'''
+    return "webrtc" if VAD_BACKEND == "webrtc" and webrtcvad is not None else "energy"
+
+def speech_frames(pcm, sample_rate):
+    '''Per-frame speech flags for 16-bit mono PCM; a trailing partial frame is ignored.'''
+    samples = np.frombuffer(pcm, dtype="<i2")
+    frame_samples = sample_rate * FRAME_MS // 1000
+    frame_count = len(samples) // frame_samples
+    if frame_count == 0:
+        return np.zeros(0, dtype=bool)
+
+    if backend_name() == "webrtc":
+        vad = webrtcvad.Vad(VAD_AGGRESSIVENESS)
+        frame_bytes = frame_samples * SAMPLE_WIDTH
+        return np.array([
+            vad.is_speech(pcm[i * frame_bytes:(i + 1) * frame_bytes], sample_rate) for i in range(frame_count)
+        ])
+
+    frames = samples[:frame_count * frame_samples].reshape(frame_count, frame_samples).astype(np.float32)
+    rms = np.sqrt(np.mean(np.square(frames / 32768.0), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10)) > VAD_ENERGY_DBFS
+
+def gate_pcm(pcm, sample_rate):
+    '''Returns (pcm, info): the clip trimmed to its speech plus padding, or None if it is silent.
+
+    `info` has the clip's `original_ms` and `speech_ms`; kept clips also have
+    the `trim_start_ms` and `trim_end_ms` cut from either end and the
+    `duration_ms` left.'''
+    bytes_per_ms = sample_rate * SAMPLE_WIDTH / 1000
+    flags = speech_frames(pcm, sample_rate)
+    info = {"original_ms": round(len(pcm) / bytes_per_ms), "speech_ms": int(flags.sum()) * FRAME_MS}
+    if info["speech_ms"] < VAD_MIN_SPEECH_MS:
+        return None, info
+
+    voiced = np.flatnonzero(flags)
+    padding_frames = VAD_PADDING_MS // FRAME_MS
+    frame_bytes = sample_rate * FRAME_MS // 1000 * SAMPLE_WIDTH
+    start = max(0, voiced[0] - padding_frames) * frame_bytes
+    end = min(len(pcm), (voiced[-1] + 1 + padding_frames) * frame_bytes)
+    # Keep the unframed tail when the speech runs up to the end of the clip
+    if voiced[-1] + 1 + padding_frames >= len(flags):
+        end = len(pcm)
+    info["trim_start_ms"] = round(start / bytes_per_ms)
+    info["duration_ms"] = round((end - start) / bytes_per_ms)
+    info["trim_end_ms"] = info["original_ms"] - info["trim_start_ms"] - info["duration_ms"]
+    return pcm[start:end], info
+
+def gate_wav(path):
+    '''Gate a 16-bit mono WAV in place; returns the `gate_pcm` info, with the file removed if silent.'''
+    with wave.open(path, "rb") as f:
+        params = f.getparams()
+        pcm = f.readframes(params.nframes)
+    trimmed, info = gate_pcm(pcm, params.framerate)
+    if trimmed is None:
+        os.remove(path)
+    elif len(trimmed) != len(pcm):
+        with wave.open(path, "wb") as f:
+            f.setparams(params)
+            f.writeframes(trimmed)
+    return info
@@ -0,0 +1,142 @@
+'''Per-speaker language memory, so steady speakers skip language detection.
+
+Every Whisper window normally starts with a detection pass. Once a speaker's
+last LANGUAGE_MEMORY_STREAK detections all picked the same language with at
+least LANGUAGE_MEMORY_CONFIDENCE, their next windows decode straight in that
+language. Detection runs again after LANGUAGE_MEMORY_RECHECK_CLIPS remembered
+clips, and at once when a remembered decode comes back empty or with an
+average log probability below LANGUAGE_MEMORY_MIN_LOGPROB (the speaker
+switched language, or someone else took the microphone).
+
+Two tiers, as in the translation cache: an in-process LRU, backed by a Redis
+hash per speaker that all workers share. Both decay: a speaker not heard
+from for LANGUAGE_MEMORY_TTL_SECONDS is detected afresh.
+'''
+import os
+import time
+from collections import OrderedDict
+from prometheus_client import Counter
+from stitcher import speaker_key
+
+MEMORY_PREFIX = "translator:language"
+
+LANGUAGE_MEMORY_ENABLED = os.getenv("TRANSCRIBER_LANGUAGE_MEMORY", "1") == "1"
+LANGUAGE_MEMORY_CONFIDENCE = float(os.getenv("LANGUAGE_MEMORY_CONFIDENCE", "0.9"))  # Detections that count
+LANGUAGE_MEMORY_STREAK = int(os.getenv("LANGUAGE_MEMORY_STREAK", "3"))  # Agreeing detections before skipping
+LANGUAGE_MEMORY_RECHECK_CLIPS = int(os.getenv("LANGUAGE_MEMORY_RECHECK_CLIPS", "20"))  # Then detect again
+LANGUAGE_MEMORY_MIN_LOGPROB = float(os.getenv("LANGUAGE_MEMORY_MIN_LOGPROB", "-1.0"))  # Whisper's own threshold
+LANGUAGE_MEMORY_TTL_SECONDS = int(os.getenv("LANGUAGE_MEMORY_TTL_SECONDS", "600"))
+MAX_SPEAKERS = 1000
+
+LANGUAGE_MEMORY = Counter(
+    "translator_language_memory_total", "Language memory lookups and invalidations by outcome", ["result"]
+)
+
+class LanguageMemory:
+    '''Each speaker's established language, with how far it can still be trusted.
+
+    `redis_client=None` keeps the memory in-process only.'''
+
+    def __init__(self, redis_client=None, max_speakers=MAX_SPEAKERS, ttl_seconds=LANGUAGE_MEMORY_TTL_SECONDS):
+        self.redis_client = redis_client
+        self.max_speakers = max_speakers
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+
+    def key(self, payload):
+        '''Redis key of a speaker's memory; languages are remembered per prim/fall setting.'''
+        room_id, speaker_id, prim_lang, fall_lang = speaker_key(payload)
+        return f"{MEMORY_PREFIX}:{room_id}:{speaker_id}:{prim_lang}:{fall_lang}"
+
+    def _get(self, payload):
+        key = self.key(payload)
+        entry = self.entries.get(key)
+        if entry is not None and entry["expires_at"] < time.monotonic():
+            del self.entries[key]
+            entry = None
+        if entry is None and self.redis_client is not None:
+            try:
+                stored = self.redis_client.hgetall(key)
+            except Exception as e:
+                print(f"⚠️ Language memory lookup failed: {e}")
+                stored = None
+            if stored:
+                entry = {
+                    "language": stored["language"],
+                    "probability": float(stored["probability"]),
+                    "streak": int(stored["streak"]),
+                    "clips": 0,
+                }
+                self._put_local(key, entry)
+        return entry
+
+    def _put_local(self, key, entry):
+        entry["expires_at"] = time.monotonic() + self.ttl_seconds
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_speakers:
+            self.entries.popitem(last=False)
+
+    def recall(self, payload):
+        '''(language, probability) to decode a speaker's window in without detection, or None.'''
+        if not LANGUAGE_MEMORY_ENABLED:
+            return None
+        entry = self._get(payload)
+        if entry is None or entry["streak"] < LANGUAGE_MEMORY_STREAK:
+            LANGUAGE_MEMORY.labels("miss").inc()
+            return None
+        if entry["clips"] >= LANGUAGE_MEMORY_RECHECK_CLIPS:
+            LANGUAGE_MEMORY.labels("recheck").inc()
+            return None
+        LANGUAGE_MEMORY.labels("hit").inc()
+        return entry["language"], entry["probability"]
+
+    def confirm(self, payload, clip_count, text, logprobs):
+        '''Check a decode made in the recalled language; returns False (and forgets it) if it failed.'''
+        key = self.key(payload)
+        entry = self.entries.get(key)
+        mean_logprob = sum(logprobs) / len(logprobs) if logprobs else None
+        if not text or (mean_logprob is not None and mean_logprob < LANGUAGE_MEMORY_MIN_LOGPROB):
+            LANGUAGE_MEMORY.labels("invalidated").inc()
+            self.forget(payload)
+            return False
+        if entry is not None:
+            entry["clips"] += clip_count
+            self._put_local(key, entry)
+        return True
+
+    def learn(self, payload, language, probability):
+        '''Record a detection; confident detections that agree with the last one extend the streak.'''
+        if not LANGUAGE_MEMORY_ENABLED:
+            return
+        key = self.key(payload)
+        previous = self._get(payload)
+        confident = probability is not None and probability >= LANGUAGE_MEMORY_CONFIDENCE
+        if not confident:
+            streak = 0
+        elif previous is not None and previous["language"] == language:
+            streak = previous["streak"] + 1
+        else:
+            streak = 1
+        entry = {"language": language, "probability": probability or 0.0, "streak": streak, "clips": 0}
+        self._put_local(key, entry)
+        if self.redis_client is None:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(key, mapping={"language": language, "probability": entry["probability"], "streak": streak})
+            pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️ Language memory store failed: {e}")
+
+    def forget(self, payload):
+        '''Drop a speaker's language, so their next window is detected.'''
+        key = self.key(payload)
+        self.entries.pop(key, None)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.unlink(key)
+        except Exception as e:
+            print(f"⚠️ Language memory store failed: {e}")
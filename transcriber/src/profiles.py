@@ -0,0 +1,81 @@
+'''Transcriber inference profiles: one named latency/quality point per deployment.
+
+A profile picks the Whisper size and precision, the decode search settings,
+the NLLB backend and the translation tier. Select one with TRANSCRIBER_PROFILE
+or `--profile`; single settings can still be overridden through OVERRIDES.
+Use benchmarks/profile_benchmark.py to measure each profile on your audio.
+'''
+import os
+
+PROFILES = {
+    # The original settings. Accurate, but needs a GPU to keep up in real time.
+    "accurate": {
+        "whisper_model": "large-v3",
+        "whisper_compute_type": {"cuda": "float16", "cpu": "int8"},
+        "beam_size": 10,
+        "primary_options": {"temperature": 0.7, "best_of": 5},
+        "fallback_options": {},
+        "nllb_model": "facebook/nllb-200-distilled-600M",
+        "nllb_backend": "transformers",
+        "nllb_compute_type": "default",
+        "translation_tier": "balanced",
+    },
+    # CPU nodes with cores to spare: a mid-size model and int8 CTranslate2 NLLB
+    "balanced": {
+        "whisper_model": "medium",
+        "whisper_compute_type": {"cuda": "float16", "cpu": "int8"},
+        "beam_size": 5,
+        "primary_options": {"temperature": 0.0},
+        "fallback_options": {"temperature": [0.0, 0.4]},
+        "nllb_model": "facebook/nllb-200-distilled-600M",
+        "nllb_backend": "ctranslate2",
+        "nllb_compute_type": "int8",
+        "translation_tier": "balanced",
+    },
+    # Small CPU nodes: greedy decoding everywhere, no temperature fallback
+    "fast": {
+        "whisper_model": "small",
+        "whisper_compute_type": {"cuda": "int8_float16", "cpu": "int8"},
+        "beam_size": 1,
+        "primary_options": {"temperature": 0.0},
+        "fallback_options": {"temperature": 0.0},
+        "nllb_model": "facebook/nllb-200-distilled-600M",
+        "nllb_backend": "ctranslate2",
+        "nllb_compute_type": "int8",
+        "translation_tier": "fast",
+    },
+}
+DEFAULT_PROFILE = "accurate"
+
+# Search settings swapped in while admission control degrades (see common/admission.py).
+# Models stay loaded as they are; only the per-clip work shrinks.
+DEGRADED_SETTINGS = {
+    "beam_size": 1,
+    "primary_options": {"temperature": 0.0},
+    "fallback_options": {"temperature": 0.0},
+    "translation_tier": "fast",
+}
+
+# Profile setting -> environment variable that overrides it
+OVERRIDES = {
+    "whisper_model": "WHISPER_MODEL",
+    "beam_size": "WHISPER_BEAM_SIZE",
+    "nllb_backend": "NLLB_BACKEND",
+    "nllb_compute_type": "NLLB_COMPUTE_TYPE",
+    "translation_tier": "TRANSLATION_TIER",
+}
+
+def load_profile(name=None):
+    '''Resolve a profile by name (default: TRANSCRIBER_PROFILE) with environment overrides applied.'''
+    name = name or os.getenv("TRANSCRIBER_PROFILE", DEFAULT_PROFILE)
+    if name not in PROFILES:
+        raise ValueError(f"Unknown transcriber profile {name!r}; choose from {', '.join(PROFILES)}")
+    profile = dict(PROFILES[name], name=name)
+    for setting, env in OVERRIDES.items():
+        if os.getenv(env):
+            profile[setting] = type(profile[setting])(os.getenv(env))
+    return profile
+
+def degraded(profile):
+    '''A profile with its search settings replaced by DEGRADED_SETTINGS.'''
+    return dict(profile, **DEGRADED_SETTINGS)
@@ -0,0 +1,48 @@
+'''Sentence and clause splitting ahead of translation.
+
+NLLB decodes autoregressively, so one long sequence is slower than the same
+text as several short sequences in one padded batch, and anything past the
+length limit is silently cut off. Splitting keeps every segment short.
+'''
+import re
+
+MAX_SEGMENT_CHARS = 300  # Roughly 80-100 tokens; well inside NLLB's 512 limit
+
+# Sentence ends: Latin punctuation followed by a space and a non-lowercase
+# character (so "e.g. this" stays whole) but not after a title such as "Mr.",
+# or CJK / Arabic / Devanagari enders
+SENTENCE_END = re.compile(
+    r"(?<!\bMr\.)(?<!\bMs\.)(?<!\bDr\.)(?<!\bSt\.)(?<!\bMrs\.)(?<=[.!?…])\s+(?=[^a-z])"
+    r"|(?<=[。！？؟।])\s*"
+)
+CLAUSE_BREAK = re.compile(r"(?<=[,;:،؛、，；])\s*")
+
+def split_sentences(text, max_chars=MAX_SEGMENT_CHARS):
+    '''Split text into sentences, breaking any longer than `max_chars` at clauses, then words.'''
+    segments = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            segments.append(sentence)
+        else:
+            segments.extend(split_long(sentence, max_chars))
+    return segments
+
+def split_long(sentence, max_chars):
+    '''Pack clauses (or words, for clauses that are too long themselves) into segments of at most `max_chars`.'''
+    pieces = []
+    for clause in CLAUSE_BREAK.split(sentence):
+        if clause:
+            pieces.extend([clause] if len(clause) <= max_chars else clause.split())
+
+    segments, current = [], ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            segments.append(current)
+            current = ""
+        current = f"{current} {piece}" if current else piece
+    if current:
+        segments.append(current)
+    return segments
@@ -0,0 +1,184 @@
+'''Stitches consecutive clips from one speaker into a single Whisper window.
+
+Whisper pads every input to a 30 s mel window, so a 5 s clip costs a full
+encoder pass. When several clips from the same speaker are claimed together
+(a backlog, or a batch), they are joined in audio order into windows of up
+to STITCH_WINDOW_SECONDS and decoded once. Each segment is then credited to
+the clip it was spoken in, so every clip still gets its own result carrying
+only its new text.
+
+The speaker's latest text is passed to Whisper as `initial_prompt`, also for
+clips decoded alone, which keeps names and spelling consistent across clip
+boundaries. That context lives in the worker process: a speaker whose clips
+land on different workers is only prompted where a worker saw the clip
+before.
+'''
+import os
+from collections import OrderedDict
+import numpy as np
+from prometheus_client import Counter
+
+SAMPLE_RATE = 16000
+
+STITCH_ENABLED = os.getenv("TRANSCRIBER_STITCH", "1") == "1"
+STITCH_WINDOW_SECONDS = float(os.getenv("STITCH_WINDOW_SECONDS", "30"))  # Whisper's own window
+STITCH_MAX_GAP_MS = int(os.getenv("STITCH_MAX_GAP_MS", "1500"))  # A longer pause starts a new window
+STITCH_MAX_CLIPS = int(os.getenv("STITCH_MAX_CLIPS", "6"))  # Clips claimed per batch slot, for stitching
+PROMPT_CHARS = int(os.getenv("STITCH_PROMPT_CHARS", "200"))  # Tail of the speaker's text used as the prompt
+PROMPT_MAX_GAP_MS = int(os.getenv("STITCH_PROMPT_MAX_GAP_MS", "15000"))  # Same line as in the merger
+MAX_SPEAKERS = 1000  # Speakers whose context is remembered
+
+WINDOWS = Counter("translator_whisper_windows_total", "Whisper windows decoded, each one or more clips")
+WINDOW_CLIPS = Counter("translator_whisper_window_clips_total", "Clips decoded in Whisper windows")
+WINDOW_AUDIO_SECONDS = Counter("translator_whisper_window_audio_seconds_total", "Audio decoded in Whisper windows")
+
+def speaker_key(payload):
+    '''Clips stitch together only within one speaker and language setting.'''
+    return payload.get("room_id"), payload.get("speaker_id"), payload.get("prim_lang"), payload.get("fall_lang")
+
+def clip_bounds(payload, audio):
+    '''(start, end) wall-clock ms of a clip's audio; the upload timestamp is when the clip ended.'''
+    end = (payload.get("timestamp") or 0) - (payload.get("trim_end_ms") or 0)
+    return end - len(audio) * 1000 / SAMPLE_RATE, end
+
+def payload_bounds(payload):
+    '''(start, end) wall-clock ms of a queued clip's speech, before its audio is loaded.
+
+    Only clips the receiver gated carry their duration; None for the rest.'''
+    if payload.get("duration_ms") is None:
+        return None
+    end = (payload.get("timestamp") or 0) - (payload.get("trim_end_ms") or 0)
+    return end - payload["duration_ms"], end
+
+def claim_plan(payloads, keep):
+    '''Indices of claimed payloads to keep: the first `keep`, plus later clips that would stitch onto them.
+
+    A later clip is kept only if it continues the speech of a kept clip from
+    the same speaker within STITCH_MAX_GAP_MS, and the window stays within
+    STITCH_MAX_CLIPS and STITCH_WINDOW_SECONDS. Clips of other speakers are
+    left for other workers. `payloads` may hold None for unreadable items,
+    which are kept so they get acked.'''
+    kept = list(range(min(keep, len(payloads))))
+    if not STITCH_ENABLED:
+        return kept
+    # Per speaker: (window start ms, last clip end ms, clips) of the window being built
+    windows = {}
+    for i in kept:
+        bounds = payloads[i] and payload_bounds(payloads[i])
+        if bounds:
+            windows[speaker_key(payloads[i])] = (bounds[0], bounds[1], 1)
+    for i in range(len(kept), len(payloads)):
+        payload = payloads[i]
+        if payload is None:
+            kept.append(i)
+            continue
+        window, bounds = windows.get(speaker_key(payload)), payload_bounds(payload)
+        if window is None or bounds is None:
+            continue
+        start, end, count = window
+        gap = bounds[0] - end
+        if (-(bounds[1] - bounds[0]) < gap <= STITCH_MAX_GAP_MS and count < STITCH_MAX_CLIPS
+                and (bounds[1] - start) / 1000 <= STITCH_WINDOW_SECONDS):
+            windows[speaker_key(payload)] = (start, bounds[1], count + 1)
+            kept.append(i)
+    return sorted(kept)
+
+def plan_windows(clips):
+    '''Group (payload, audio) clips into windows of consecutive clips from one speaker.
+
+    A window grows while the next clip starts at most STITCH_MAX_GAP_MS after
+    the previous one ended and the window stays within STITCH_WINDOW_SECONDS.
+    With stitching disabled every clip is its own window.'''
+    if not STITCH_ENABLED:
+        return [[clip] for clip in clips]
+
+    ordered = sorted(clips, key=lambda clip: (str(speaker_key(clip[0])), clip_bounds(*clip)[0]))
+    windows = []
+    for payload, audio in ordered:
+        if windows:
+            window = windows[-1]
+            previous_payload, previous_audio = window[-1]
+            start, end = clip_bounds(payload, audio)
+            gap = start - clip_bounds(previous_payload, previous_audio)[1]
+            # Overlaps are cut and gaps filled, so the window spans first start to last end
+            seconds = (end - clip_bounds(*window[0])[0]) / 1000
+            if (speaker_key(payload) == speaker_key(previous_payload)
+                    and -(end - start) < gap <= STITCH_MAX_GAP_MS and seconds <= STITCH_WINDOW_SECONDS):
+                window.append((payload, audio))
+                continue
+        windows.append([(payload, audio)])
+    return windows
+
+def stitch(window):
+    '''Join a window's clips into one array; returns (audio, offsets) with each clip's (start, end) seconds.
+
+    Audio two clips both recorded is kept once, and short pauses between
+    clips are filled with silence so segment times line up with the clips.'''
+    pieces, offsets = [], []
+    position = 0
+    previous_end = None
+    for payload, audio in window:
+        start, end = clip_bounds(payload, audio)
+        if previous_end is not None:
+            gap_samples = int((start - previous_end) * SAMPLE_RATE / 1000)
+            if gap_samples > 0:
+                pieces.append(np.zeros(gap_samples, dtype=np.float32))
+                position += gap_samples
+            else:
+                audio = audio[-gap_samples:]
+        offsets.append((position / SAMPLE_RATE, (position + len(audio)) / SAMPLE_RATE))
+        pieces.append(audio)
+        position += len(audio)
+        previous_end = end
+    return np.concatenate(pieces) if len(pieces) > 1 else pieces[0], offsets
+
+def clip_index(offsets, start, end):
+    '''Which clip a segment spanning `start`-`end` seconds was spoken in: the one holding its midpoint.'''
+    middle = (start + end) / 2
+    index = 0
+    for i, (clip_start, _) in enumerate(offsets):
+        if clip_start <= middle:
+            index = i
+    return index
+
+def assign_segments(segments, offsets):
+    '''Credit (start, end, text) segments to their clips; returns each clip's text.'''
+    texts = [[] for _ in offsets]
+    for start, end, text in segments:
+        if text:
+            texts[clip_index(offsets, start, end)].append(text)
+    return [" ".join(parts) for parts in texts]
+
+def record_window(clip_count, audio_seconds):
+    '''Count a decoded window, so encoder passes per second of speech can be tracked.'''
+    WINDOWS.inc()
+    WINDOW_CLIPS.inc(clip_count)
+    WINDOW_AUDIO_SECONDS.inc(audio_seconds)
+
+class SpeakerContext:
+    '''Each speaker's most recent transcript, used to prompt the decode of their next clips.'''
+
+    def __init__(self, max_speakers=MAX_SPEAKERS):
+        self.max_speakers = max_speakers
+        self.entries = OrderedDict()
+
+    def prompt(self, payload, start_ms):
+        '''Prompt for a window starting at `start_ms`, or None after a long pause or a new speaker.'''
+        entry = self.entries.get(speaker_key(payload))
+        if entry is None or start_ms - entry["end_ms"] > PROMPT_MAX_GAP_MS:
+            return None
+        return entry["text"] or None
+
+    def remember(self, payload, start_ms, end_ms, text):
+        '''Record what a speaker said between `start_ms` and `end_ms`, after their earlier text.'''
+        key = speaker_key(payload)
+        previous = self.entries.pop(key, None)
+        if previous and start_ms - previous["end_ms"] <= PROMPT_MAX_GAP_MS:
+            text = f"{previous['text']} {text}".strip()
+            end_ms = max(end_ms, previous["end_ms"])
+        if len(text) > PROMPT_CHARS:
+            # Start the prompt on a word boundary
+            text = text[-PROMPT_CHARS:].split(" ", 1)[-1]
+        self.entries[key] = {"end_ms": end_ms, "text": text}
+        while len(self.entries) > self.max_speakers:
+            self.entries.popitem(last=False)
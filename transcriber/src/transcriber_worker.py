@@ -1,17 +1,38 @@
 '''Script to transcribe audio files with translations included'''
 
+import argparse
 import signal
 import sys
 import time
 import os
-import json
+import numpy as np
 import torch
 import redis
-from faster_whisper import WhisperModel
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from prometheus_client import Counter
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.admission import ADMISSION_SHED_SECONDS, AdmissionController, clip_age, record as record_admission
+from common.keys import DEFAULT_ROOM, TRANSCRIBER_QUEUE
+from common.model_registry import LOCAL_FILES_ONLY, MODEL_CACHE_DIR, ModelRegistry
+from common.metrics import (
+    BATCH_SECONDS, PROCESSED_TOTAL, mark, mark_first_partial, model_timer, serve_metrics, track_queue_depth
+)
+from common.queue_consumer import QueueConsumer
+from common import wire
+from common.sharding import merger_ring, unmerged_queue_for_room
+from language_memory import LanguageMemory
+from profiles import PROFILES, degraded, load_profile
+from sentences import split_sentences
+from stitcher import (
+    SAMPLE_RATE, STITCH_ENABLED, STITCH_MAX_CLIPS, SpeakerContext, assign_segments, claim_plan, clip_bounds,
+    clip_index, plan_windows, record_window, stitch
+)
+from translation_backends import load_translation_backend
+from translation_cache import TranslationCache
 
 # ─── Graceful Shutdown Handler ───────────────────────────────────────────────
-def shutdown_handler():
+def shutdown_handler(signum=None, frame=None):
     '''Handle shutdown signals gracefully.'''
     print("\n🛑 Caught shutdown signal. Cleaning up...")
     if torch.cuda.is_available():
@@ -30,26 +51,169 @@ print(f"⚙️  Using device: {DEVICE}")
 
 # ─── Redis Setup ─────────────────────────────────────────────────────────────
 redis_client = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+# In-memory clips arrive as raw PCM, and queue items may be msgpack (see common/wire.py),
+# so both are read through a client that does not decode replies
+redis_binary = redis.Redis(host="localhost", port=6379, db=0, decode_responses=False)
+queue_consumer = QueueConsumer(redis_binary, TRANSCRIBER_QUEUE)
+# Rooms are sharded across merger nodes; each result goes to its room's owner
+merger_nodes = merger_ring()
 
 # ─── Shared Volume Setup ─────────────────────────────────────────────────────
 SHARED_VOLUME_PATH = os.getenv("SHARED_VOLUME_PATH", "/shared_volume")
 AUDIO_DIR = os.path.join(SHARED_VOLUME_PATH, "blerbs")
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
-# ─── Whisper Model Setup ─────────────────────────────────────────────────────
-whisper_model = WhisperModel(
-    model_size_or_path="large-v3",
-    device=DEVICE,
-    compute_type="float16" if DEVICE == "cuda" else "int8"
+# ─── Decode Settings ─────────────────────────────────────────────────────────
+PRIMARY_CONFIDENCE = 0.9  # Minimum detection probability to decode in prim_lang
+
+# Beam size and the decode settings for the primary and the fallback language
+# come from the inference profile (see use_profile below)
+BEAM_SIZE = None
+PRIMARY_DECODE_OPTIONS = None
+FALLBACK_DECODE_OPTIONS = None
+
+# Streaming mode sends the transcript so far to the merger after every Whisper
+# segment, marked partial and untranslated, so users see words before the
+# clip is fully decoded. The final result replaces it in place.
+STREAM_PARTIALS = os.getenv("TRANSCRIBER_STREAM_PARTIALS", "0") == "1"
+
+# ─── Batching Setup ──────────────────────────────────────────────────────────
+# Claim up to BATCH_SIZE payloads, waiting at most BATCH_WAIT_MS after the first
+# one arrives. The batch's translations share padded NLLB calls per language
+# pair. Whisper still decodes one window (a clip, or one speaker's stitched
+# clips) per call: with BATCH_SIZE > 1, BatchedInferencePipeline batches up to
+# WHISPER_BATCH_SIZE VAD chunks *within* that window, never across payloads,
+# since each payload carries its own language and prompt. BATCH_SIZE=1 keeps
+# the one-at-a-time behaviour (plus, with stitching, clips continuing that
+# speaker's speech); larger values trade p50 latency for throughput under load.
+BATCH_SIZE = max(1, int(os.getenv("TRANSCRIBER_BATCH_SIZE", "1")))
+BATCH_WAIT_MS = int(os.getenv("TRANSCRIBER_BATCH_WAIT_MS", "200"))
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+
+# ─── Stitching Setup ─────────────────────────────────────────────────────────
+# Consecutive clips from one speaker that are claimed together are decoded as
+# one Whisper window, and every decode is prompted with the speaker's recent
+# text (see stitcher.py). Stitching looks at whatever backlog is already
+# waiting, up to STITCH_MAX_CLIPS per batch slot, without waiting for more,
+# and keeps only clips that continue a claimed clip's speech; the rest go
+# straight back to the queue for other workers.
+CLAIM_LIMIT = BATCH_SIZE * STITCH_MAX_CLIPS if STITCH_ENABLED else BATCH_SIZE
+speaker_context = SpeakerContext()
+
+# ─── Admission Control Setup ─────────────────────────────────────────────────
+# Every worker watches the queue's age (see common/admission.py). From
+# "degrade" up, batches use the cheap DEGRADED_SETTINGS search settings and
+# skip the fallback-language retry; from "shed" up, claimed clips older than
+# ADMISSION_SHED_SECONDS are acked without being transcribed.
+admission = AdmissionController(redis_binary)
+DEGRADED = False
+
+# ─── Language Memory Setup ───────────────────────────────────────────────────
+# Speakers with an established language decode straight in it, skipping the
+# detection pass; detection returns periodically or when the decode falters
+# (see language_memory.py). Shared across workers through Redis.
+language_memory = LanguageMemory(redis_client)
+
+# ─── Metrics Setup ───────────────────────────────────────────────────────────
+# Served from main(); the worker pool gives each process its own port
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9105"))
+
+# ─── Translation Settings ────────────────────────────────────────────────────
+# Search settings per latency tier. Text is translated sentence by sentence,
+# so output length is bounded by each batch's longest input rather than a
+# fixed 512 tokens. The profile picks the default tier.
+TRANSLATION_TIERS = {
+    "fast": {"beam_size": 1},
+    "balanced": {"beam_size": 2},
+    "quality": {"beam_size": 4},
+}
+TRANSLATION_TIER = None
+TRANSLATION_MAX_BATCH = int(os.getenv("TRANSLATION_MAX_BATCH", "32"))  # Sentences per backend call
+
+# ─── Translation Cache Setup ─────────────────────────────────────────────────
+# Repeated phrases skip NLLB. The local LRU holds TRANSLATION_CACHE_SIZE entries
+# for TRANSLATION_CACHE_TTL seconds; the Redis tier is shared by every worker
+# for TRANSLATION_CACHE_REDIS_TTL seconds (0 disables it).
+translation_cache = TranslationCache(
+    model_id=None,  # Set by the profile
+    max_entries=int(os.getenv("TRANSLATION_CACHE_SIZE", "10000")),
+    ttl_seconds=int(os.getenv("TRANSLATION_CACHE_TTL", "3600")),
+    redis_client=redis_client,
+    redis_ttl=int(os.getenv("TRANSLATION_CACHE_REDIS_TTL", "86400"))
 )
 
-BEAM_SIZE = 10
-
-# ─── NLLB Translator Setup ───────────────────────────────────────────────────
-tokenizer = AutoTokenizer.from_pretrained("facebook/nllb-200-distilled-600M")
-translator = AutoModelForSeq2SeqLM.from_pretrained("facebook/nllb-200-distilled-600M")
-if DEVICE == "cuda":
-    translator = translator.to(DEVICE)
+# ─── Profile Setup ───────────────────────────────────────────────────────────
+# Model sizes, precision, search settings and the NLLB backend come from the
+# inference profile: TRANSCRIBER_PROFILE, or --profile on the command line.
+PROFILE = None
+
+def use_search_settings(settings):
+    '''Apply a profile's decode and translation search settings.'''
+    global BEAM_SIZE, PRIMARY_DECODE_OPTIONS, FALLBACK_DECODE_OPTIONS, TRANSLATION_TIER
+    BEAM_SIZE = settings["beam_size"]
+    PRIMARY_DECODE_OPTIONS = settings["primary_options"]
+    FALLBACK_DECODE_OPTIONS = settings["fallback_options"]
+    TRANSLATION_TIER = settings["translation_tier"]
+
+def use_profile(name=None):
+    '''Apply an inference profile's settings; load_models() then loads its models.'''
+    global PROFILE, DEGRADED
+    PROFILE = load_profile(name)
+    use_search_settings(PROFILE)
+    DEGRADED = False
+    # Quantized backends translate slightly differently, so they cache apart
+    translation_cache.model_id = f"{PROFILE['nllb_model']}:{PROFILE['nllb_backend']}:{PROFILE['nllb_compute_type']}"
+    print(f"🎛️  Profile {PROFILE['name']}: Whisper {PROFILE['whisper_model']} (beam {BEAM_SIZE}), "
+          f"NLLB via {PROFILE['nllb_backend']} ({PROFILE['nllb_compute_type']})")
+
+use_profile()
+
+# ─── Model Setup ─────────────────────────────────────────────────────────────
+# load_models() starts Whisper and NLLB loading in parallel on background
+# threads, so importing this module stays cheap (the pool launcher and the
+# benchmarks import it without loading weights). The worker consumes as soon
+# as Whisper is ready; clips transcribed before NLLB is up are shown
+# untranslated and held until it is (see process_batch).
+model_registry = ModelRegistry(required=("whisper",))
+whisper_model = None
+batched_whisper = None
+nllb = None
+
+MAX_DEFERRED_BATCHES = int(os.getenv("TRANSCRIBER_MAX_DEFERRED_BATCHES", "16"))
+deferred_batches = []
+
+def load_whisper():
+    '''Load the profile's Whisper model from MODEL_CACHE_DIR (downloading it unless MODEL_LOCAL_ONLY).'''
+    global whisper_model, batched_whisper
+    model = WhisperModel(
+        model_size_or_path=PROFILE["whisper_model"],
+        device=DEVICE,
+        compute_type=PROFILE["whisper_compute_type"][DEVICE],
+        cpu_threads=int(os.getenv("WHISPER_CPU_THREADS", "0")),
+        download_root=MODEL_CACHE_DIR,
+        local_files_only=LOCAL_FILES_ONLY
+    )
+    batched_whisper = BatchedInferencePipeline(model=model) if BATCH_SIZE > 1 else None
+    whisper_model = model
+    return model
+
+def load_nllb():
+    '''Load the profile's NLLB backend.'''
+    global nllb
+    threads = int(os.getenv("TORCH_NUM_THREADS", "0"))
+    if threads:
+        torch.set_num_threads(threads)
+    nllb = load_translation_backend(PROFILE, DEVICE, threads)
+    return nllb
+
+def load_models():
+    '''Start loading the profile's Whisper and NLLB models in parallel; returns immediately.'''
+    model_registry.load("whisper", load_whisper)
+    model_registry.load("nllb", load_nllb)
+
+def translator_ready():
+    '''Whether NLLB is loaded (or a stand-in has been set).'''
+    return nllb is not None
 
 # ─── ISO-to-NLLB Mapping ─────────────────────────────────────────────────────
 ISO2NLLB = {
@@ -67,153 +231,567 @@ ISO2NLLB = {
     "de": "deu_Latn",
 }
 
-print("🧠 Whisper transcriber ready.  🔄 Translator ready.")
-
 def contains_arabic(text):
     '''Check if text contains Arabic characters.'''
     return any('\u0600' <= c <= '\u06FF' for c in text)
 
-# ─── Main Loop ───────────────────────────────────────────────────────────────
-try:
-    while True:
-        item = redis_client.lpop("translator:queue")
-        if not item:
-            time.sleep(0.5)
-            continue
-
-        payload = json.loads(item) 
-        print(payload)
-        filename = payload.get("filename")
-        speaker_id = payload.get("speaker_id")
-        timestamp = payload.get("timestamp")
-        prim_lang = payload.get("prim_lang")
-        fall_lang = payload.get("fall_lang")
-
-        # Construct full path using shared volume
-        file_path = os.path.join(AUDIO_DIR, filename)
-
-        print(f"\n🔄 Transcribing {file_path}")
-        print(f"Timestamp: {timestamp}")
-        print(f"Speaker ID: {speaker_id}")
-        print(f"Primary: {prim_lang}, Fallback: {fall_lang}")
-        start_time = time.perf_counter()
-
-        TEXT = None
-        TEXT_ERROR = None
-        TRANSLATION = None
-        TRANSLATION_ERROR = None
-        SRC_LANG = None
-        LANG = None
-        LANG_CONF = None
+# ─── Batch Collection ────────────────────────────────────────────────────────
+def readable(item):
+    '''A raw queue item's payload, or None if it cannot be decoded.'''
+    try:
+        return wire.loads(item)
+    except ValueError:
+        return None
+
+def collect_batch():
+    '''Claim up to BATCH_SIZE raw items, waiting at most BATCH_WAIT_MS after the first one.
+
+    With stitching, clips already waiting that continue a claimed clip's
+    speech are claimed too (up to CLAIM_LIMIT); other clips are released.'''
+    batch = queue_consumer.drain(CLAIM_LIMIT)
+    if len(batch) > BATCH_SIZE:
+        keep = set(claim_plan([readable(item) for item in batch], BATCH_SIZE))
+        queue_consumer.release(*(item for i, item in enumerate(batch) if i not in keep))
+        batch = [item for i, item in enumerate(batch) if i in keep]
+    if not batch:
+        return batch
+    deadline = time.perf_counter() + BATCH_WAIT_MS / 1000
+    while len(batch) < BATCH_SIZE:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        item = queue_consumer.pop(timeout=remaining)
+        if item is None:
+            break
+        batch.append(item)
+    return batch
+
+# ─── Language Resolution ─────────────────────────────────────────────────────
+# How each clip's decode language was chosen. "fallback" clips used to pay for a
+# full auto-detect decode before the fallback decode; "retry" clips still do.
+# "remembered" clips skipped detection altogether.
+LANG_STATS = {"primary": 0, "fallback": 0, "retry": 0, "remembered": 0}
+LANGUAGE_RESOLUTION = Counter(
+    "translator_language_resolution_total", "How each clip's decode language was chosen", ["outcome"]
+)
 
+def record_language_resolution(outcome):
+    '''Count a language-resolution outcome locally and in the metrics.'''
+    LANG_STATS[outcome] += 1
+    LANGUAGE_RESOLUTION.labels(outcome).inc()
+    print(f"📊 Second decodes avoided: {LANG_STATS['fallback']} "
+          f"(primary {LANG_STATS['primary']}, retried {LANG_STATS['retry']}, "
+          f"detection skipped {LANG_STATS['remembered']})")
+
+def resolve_language(audio, prim_lang, fall_lang):
+    '''Pick the decode language from one detection pass over the VAD-trimmed audio.
+
+    Mirrors the old two-pass rule without the first decode: stay in prim_lang
+    only when it is detected with at least PRIMARY_CONFIDENCE, otherwise go
+    straight to fall_lang. Returns (language, probability, used_fallback).'''
+    with model_timer("whisper_detect"):
+        detected, detected_conf, all_probs = whisper_model.detect_language(audio=audio, vad_filter=True)
+    probs = dict(all_probs)
+    print(f"🧠 Detected: {detected} ({detected_conf:.2%}), "
+          f"{prim_lang}: {probs.get(prim_lang, 0):.2%}, {fall_lang}: {probs.get(fall_lang, 0):.2%}")
+
+    if fall_lang == prim_lang:
+        return detected, detected_conf, False
+    if detected == prim_lang and detected_conf >= PRIMARY_CONFIDENCE:
+        return prim_lang, detected_conf, False
+    return fall_lang, probs.get(fall_lang, 0.0), True
+
+# ─── Audio Loading ───────────────────────────────────────────────────────────
+def audio_source(payload):
+    '''Describe where a payload's audio lives, for logging.'''
+    if payload.get("audio_key"):
+        return f"redis:{payload['audio_key']}"
+    return os.path.join(AUDIO_DIR, payload.get("filename"))
+
+def load_audio(payload):
+    '''Load a payload's clip as 16kHz mono float32, from Redis PCM or the shared volume.'''
+    audio_key = payload.get("audio_key")
+    if not audio_key:
+        return decode_audio(os.path.join(AUDIO_DIR, payload.get("filename")), sampling_rate=16000)
+
+    if payload.get("sample_rate", 16000) != 16000 or payload.get("sample_format", "s16le") != "s16le":
+        raise ValueError(f"Unsupported PCM payload: {payload.get('sample_rate')} Hz {payload.get('sample_format')}")
+    pcm = redis_binary.get(audio_key)
+    if pcm is None:
+        raise ValueError(f"Audio {audio_key} expired before it was transcribed")
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+def remove_audio(payload):
+    '''Delete a payload's audio (PCM key or shared-volume file) once it has been acked.'''
+    if payload.get("audio_key"):
+        redis_binary.unlink(payload["audio_key"])
+        return
+    filename = payload.get("filename")
+    file_path = os.path.join(AUDIO_DIR, filename) if filename else None
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+# ─── Transcription ───────────────────────────────────────────────────────────
+def run_whisper(audio, **options):
+    '''Run Whisper on one window, batching its VAD chunks through the batched pipeline when enabled.'''
+    if batched_whisper is not None:
+        return batched_whisper.transcribe(audio, batch_size=WHISPER_BATCH_SIZE, **options)
+    return whisper_model.transcribe(audio, **options)
+
+def decode_segments(audio, language, options, on_segment=None, logprobs=None):
+    '''Decode audio in a fixed language; returns its segments as (start s, end s, text).
+
+    `on_segment` is called with the segments so far as each one is generated;
+    `logprobs`, when given, collects each segment's average log probability.'''
+    # Segments are generated lazily, so consuming them has to happen inside the timer
+    with model_timer("whisper_decode"):
+        segments, _ = run_whisper(
+            audio,
+            language=language,
+            beam_size=BEAM_SIZE,
+            task="transcribe",
+            vad_filter=True,
+            word_timestamps=False,
+            multilingual=False,
+            **options
+        )
+        decoded = []
+        for seg in segments:
+            decoded.append((seg.start, seg.end, seg.text.strip()))
+            if logprobs is not None:
+                logprobs.append(seg.avg_logprob)
+            if on_segment is not None:
+                on_segment(decoded)
+        return decoded
+
+def join_segments(segments):
+    '''The transcript of (start, end, text) segments.'''
+    return " ".join(text for _, _, text in segments if text)
+
+def decode_in(audio, language, options, on_segment=None):
+    '''Decode a clip in a fixed language and return the joined transcript.
+
+    `on_segment` is called with the transcript so far as each segment is generated.'''
+    callback = (lambda decoded: on_segment(join_segments(decoded))) if on_segment else None
+    return join_segments(decode_segments(audio, language, options, callback))
+
+def failed_transcript(error):
+    '''Transcript of a clip that could not be transcribed.'''
+    print(f"❌ {error}")
+    return {
+        "text": "",
+        "text_error": error,
+        "src_lang": None,
+        "lang": None,
+        "lang_conf": None,
+        "translation": None,
+        "translation_error": None,
+    }
+
+def transcribe_window(clips, on_partial=None):
+    '''Transcribe (payload, audio) clips from one speaker as a single Whisper window.
+
+    Decodes in the speaker's remembered language, or else resolves the
+    language once, decodes once prompted with the speaker's recent text, and
+    credits each segment to the clip it was spoken in.
+    Returns one transcript per clip. `on_partial(payload, text, language)`
+    receives a clip's transcript so far after each of its segments.'''
+    first = clips[0][0]
+    prim_lang = first.get("prim_lang")
+    fall_lang = first.get("fall_lang")
+
+    for payload, _ in clips:
+        print(f"\n🔄 Transcribing {audio_source(payload)}")
+        print(f"Timestamp: {payload.get('timestamp')}")
+    print(f"Speaker ID: {first.get('speaker_id')}")
+    print(f"Primary: {prim_lang}, Fallback: {fall_lang}")
+
+    TEXT = None
+    TEXT_ERROR = None
+    SRC_LANG = None
+    LANG = None
+    LANG_CONF = None
+
+    try:
+        audio, offsets = stitch(clips)
+        start_ms, end_ms = clip_bounds(*clips[0])[0], clip_bounds(*clips[-1])[1]
+        if len(clips) > 1:
+            print(f"🧵 Stitched {len(clips)} clips into one {len(audio) / SAMPLE_RATE:.1f}s window")
+        prompt = speaker_context.prompt(first, start_ms)
+        # Partials of a decode in the remembered language wait until it is confirmed,
+        # so a wrong guess never opens a line in a language the final result is not in
+        holding = False
+        held = {}
+
+        def on_segment(decoded):
+            # Reads LANG when called, so a retry in the fallback language streams as such
+            start, end, text = decoded[-1]
+            if text:
+                index = clip_index(offsets, start, end)
+                partial = (clips[index][0], assign_segments(decoded, offsets)[index], LANG)
+                if holding:
+                    held[index] = partial
+                else:
+                    on_partial(*partial)
+
+        def decode(language, options, logprobs=None):
+            options = dict(options, initial_prompt=prompt) if prompt else options
+            return decode_segments(audio, language, options, on_segment if on_partial else None, logprobs)
+
+        segments = None
+        fallback_ran = False
+        remembered = language_memory.recall(first)
+        if remembered is not None:
+            LANG, LANG_CONF = remembered
+            print(f"🧠 Remembered language: {LANG}")
+            logprobs = []
+            options = PRIMARY_DECODE_OPTIONS if LANG == prim_lang else FALLBACK_DECODE_OPTIONS
+            holding = True
+            segments = decode(LANG, options, logprobs)
+            holding = False
+            if language_memory.confirm(first, len(clips), join_segments(segments), logprobs):
+                record_language_resolution("remembered")
+                for partial in held.values():
+                    on_partial(*partial)
+            else:
+                print(f"⚠️ Decode in remembered {LANG} faltered; detecting the language")
+                segments = None
+
+        if segments is None:
+            LANG, LANG_CONF, used_fallback = resolve_language(audio, prim_lang, fall_lang)
+            detected_conf = LANG_CONF
+            if used_fallback:
+                print(f"⚠️ Fallback selected up front. Decoding with {fall_lang}")
+                segments = decode(LANG, FALLBACK_DECODE_OPTIONS)
+                record_language_resolution("fallback")
+            else:
+                print(f"🔠 Decoding with primary language: {LANG}")
+                segments = decode(LANG, PRIMARY_DECODE_OPTIONS)
+                if not join_segments(segments) and fall_lang != prim_lang and not DEGRADED:
+                    # An empty primary decode still warrants a second pass, unless degraded
+                    print(f"⚠️ Fallback triggered. Retrying with {fall_lang}")
+                    LANG = fall_lang
+                    detected_conf = None  # The detection was wrong, so it does not count
+                    segments = decode(LANG, FALLBACK_DECODE_OPTIONS)
+                    fallback_ran = True
+                    record_language_resolution("retry")
+                else:
+                    record_language_resolution("primary")
+            language_memory.learn(first, LANG, detected_conf)
+        record_window(len(clips), len(audio) / SAMPLE_RATE)
+        TEXT = join_segments(segments)
+        print(f"📜 Transcript ({LANG}): {TEXT}")
+
+        if not TEXT and fallback_ran:
+            TEXT_ERROR = "ERROR: Fallback transcription returned empty string"
+        elif not TEXT:
+            TEXT_ERROR = f"ERROR: Transcription in {LANG} returned empty string"
+
+        SRC_LANG = ISO2NLLB.get(LANG)
+        speaker_context.remember(first, start_ms, end_ms, TEXT)
+
+    except Exception as e:
+        return [failed_transcript(f"Transcription error: {e}") for _ in clips]
+
+    texts = assign_segments(segments, offsets)
+    return [{
+        "text": text,
+        "text_error": TEXT_ERROR,
+        "src_lang": SRC_LANG,
+        "lang": LANG,
+        "lang_conf": LANG_CONF,
+        "translation": None,
+        "translation_error": None,
+        # A clip whose words all landed in its neighbours has nothing to translate
+        "stitched": len(clips) > 1 and bool(TEXT),
+    } for text in texts]
+
+def transcribe_payload(payload, on_partial=None):
+    '''Transcribe a queued payload on its own, decoding once where possible.'''
+    try:
+        audio = load_audio(payload)
+    except Exception as e:
+        return failed_transcript(f"Transcription error: {e}")
+    return transcribe_window([(payload, audio)], on_partial)[0]
+
+# ─── Translation ─────────────────────────────────────────────────────────────
+def target_language(src_lang):
+    '''Everything translates to English, except English, which translates to Arabic.'''
+    return "eng_Latn" if src_lang != "eng_Latn" else "arb_Arab"
+
+def set_translation(transcript, TRANSLATION):
+    '''Store a translation on a transcript, flagging empty results.'''
+    transcript["translation"] = TRANSLATION
+    if not TRANSLATION:
+        transcript["translation_error"] = "ERROR: Translation returned empty string"
+        print("❌ Translation failed.")
+    else:
+        print(f"✅ Translated text: {TRANSLATION}")
+
+def generate_translations(sentences, SRC_LANG, TGT_LANG, settings):
+    '''Translate sentences through the NLLB backend in batches of up to TRANSLATION_MAX_BATCH.'''
+    # Similar lengths share a batch so little of each batch is padding
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+    translations = [None] * len(sentences)
+
+    for offset in range(0, len(order), TRANSLATION_MAX_BATCH):
+        chunk = order[offset:offset + TRANSLATION_MAX_BATCH]
+        with model_timer("nllb"):
+            outputs = nllb.translate([sentences[i] for i in chunk], SRC_LANG, TGT_LANG, settings["beam_size"])
+        for i, TRANSLATION in zip(chunk, outputs):
+            translations[i] = TRANSLATION
+    return translations
+
+def translate_batch(transcripts, tier=None):
+    '''Translate transcripts in place, sentence by sentence.
+
+    Every transcript is split into sentences; cached sentences skip NLLB, and
+    the rest of each (src, tgt) pair go through padded batch generate calls,
+    each distinct sentence once. Translations are then reassembled in order.'''
+    settings = TRANSLATION_TIERS[tier or TRANSLATION_TIER]
+    pending = [t for t in transcripts if t["text"] and t["src_lang"]]
+
+    # (transcript index, language pair, sentence, cache key) for every sentence
+    pieces = []
+    for index, transcript in enumerate(pending):
+        SRC_LANG = transcript["src_lang"]
+        TGT_LANG = target_language(SRC_LANG)
+        for sentence in split_sentences(transcript["text"]):
+            pieces.append((index, (SRC_LANG, TGT_LANG), sentence, translation_cache.key(sentence, SRC_LANG, TGT_LANG)))
+    cached = translation_cache.get_many([key for *_, key in pieces])
+
+    groups = {}
+    for (_, pair, sentence, key), hit in zip(pieces, cached):
+        if hit is None:
+            groups.setdefault(pair, {}).setdefault(key, sentence)
+    if pieces:
+        print(f"♻️ {len(pieces) - cached.count(None)} of {len(pieces)} sentence(s) served from cache")
+
+    fresh = {}
+    for (SRC_LANG, TGT_LANG), by_key in groups.items():
+        print(f"🔄 Translating {len(by_key)} sentence(s) from {SRC_LANG} to {TGT_LANG}")
+        translations = generate_translations(list(by_key.values()), SRC_LANG, TGT_LANG, settings)
+        fresh.update(zip(by_key, translations))
+    translation_cache.put_many(fresh.items())
+
+    parts = [[] for _ in pending]
+    for (index, _, _, key), hit in zip(pieces, cached):
+        parts[index].append(hit if hit is not None else fresh[key])
+    for transcript, translated in zip(pending, parts):
+        set_translation(transcript, " ".join(part for part in translated if part))
+
+def clip_id(payload):
+    '''Stable id of a clip, so its final result replaces its partials.'''
+    return payload.get("audio_key") or payload.get("filename")
+
+def build_result(payload, transcript, partial=False):
+    '''Build the translator:unmerged entry for a processed payload (or a partial of one).'''
+    # An empty translation is a failure, unless stitching credited all the clip's words to its neighbours
+    credited_away = transcript.get("stitched") and not transcript["text"]
+    no_translation = "" if partial or credited_away else "[Translation failed]"
+    return {
+        "room_id": payload.get("room_id") or DEFAULT_ROOM,
+        "speaker_id": payload.get("speaker_id"),
+        "start_timestamp": payload.get("timestamp"),
+        # Where the clip's speech sits before its timestamp, when the receiver gated it
+        "duration_ms": payload.get("duration_ms"),
+        "trim_end_ms": payload.get("trim_end_ms"),
+        "clip_id": clip_id(payload),
+        "partial": partial,
+        "text": transcript["text"],
+        "text_error": transcript["text_error"],
+        "translation": transcript["translation"] or no_translation,
+        "translation_error": transcript["translation_error"],
+        "language": transcript["src_lang"],
+        "raw_language": transcript["lang"],
+        "language_confidence": transcript["lang_conf"],
+        "timings": payload.get("timings"),
+    }
+
+def publish_partial(payload, text, lang):
+    '''Send a clip's transcript so far to its merger ahead of translation.'''
+    print(f"⚡ Partial ({lang}): {text}")
+    mark_first_partial(payload.get("timings"))
+    result = build_result(payload, {
+        "text": text,
+        "text_error": None,
+        "src_lang": ISO2NLLB.get(lang),
+        "lang": lang,
+        "lang_conf": None,
+        "translation": None,
+        "translation_error": None,
+    }, partial=True)
+    # Delivery latency is measured on the final result only
+    result["timings"] = None
+    redis_client.rpush(unmerged_queue_for_room(merger_nodes, result["room_id"]), wire.dumps("blerb", result))
+
+def parse_batch(batch):
+    '''Decode a batch of raw queue items, skipping any that are not payloads.'''
+    payloads = []
+    for item in batch:
         try:
-            # Primary transcription attempt
-            # Try to let it process naturally, and if confidence is low fall back to default
-            print(f"🔠 Trying primary language: {prim_lang}")
-            segments, info = whisper_model.transcribe(
-                file_path,
-                language=None,
-                beam_size=BEAM_SIZE,
-                task="transcribe",
-                vad_filter=True,
-                word_timestamps=False,
-                multilingual=False,
-                temperature=0.7,
-                best_of=5
-            )
-            TEXT = " ".join(seg.text for seg in segments).strip()
-            LANG = info.language
-            LANG_CONF = info.language_probability
-            print(f"🧠 Detected: {LANG} ({LANG_CONF:.2%})")
-            print(f"📜 Transcript: {TEXT}")
-
-            # Determine fallback need
-            # Retry in primary lang
-
-            print(fall_lang)
-
-            fallback_needed = (
-                not TEXT or
-                LANG != prim_lang or
-                LANG_CONF < 0.9
-            ) and fall_lang != prim_lang
-
-            if fallback_needed:
-                print(f"⚠️ Fallback triggered. Retrying with {fall_lang}")
-                segments, info = whisper_model.transcribe(
-                    file_path,
-                    language=fall_lang,
-                    beam_size=BEAM_SIZE,
-                    task="transcribe",
-                    vad_filter=True,
-                    word_timestamps=False,
-                    multilingual=False
-                )
-                TEXT = " ".join(seg.text for seg in segments).strip()
-                LANG = info.language
-                LANG_CONF = info.language_probability
-                print(f"📜 Fallback transcript: {TEXT}")
-                print(f"🧠 Fallback language: {LANG} ({LANG_CONF:.2%})")
-                if not TEXT:
-                    TEXT_ERROR = "ERROR: Fallback transcription returned empty string"
-
-            SRC_LANG = ISO2NLLB.get(LANG)
+            payloads.append(wire.loads(item))
+        except ValueError:
+            print("⚠️ Could not decode payload:", item)
+    return payloads
+
+def follow_admission():
+    '''Switch to the degraded search settings and back as the admission level moves.'''
+    global DEGRADED
+    degrade = admission.at_least("degrade")
+    if degrade == DEGRADED:
+        return
+    use_search_settings(degraded(PROFILE) if degrade else PROFILE)
+    DEGRADED = degrade
+    print("🐢 Backlog: decoding with degraded settings" if degrade else f"🎛️  Back to profile {PROFILE['name']} settings")
+
+def shed_stale(payloads):
+    '''Split payloads into (kept, shed): while shedding, clips older than ADMISSION_SHED_SECONDS are shed.'''
+    if not admission.at_least("shed"):
+        return payloads, []
+    now = time.time()
+    kept, shed = [], []
+    for payload in payloads:
+        (shed if clip_age(payload, now) > ADMISSION_SHED_SECONDS else kept).append(payload)
+    if shed:
+        record_admission("shed", len(shed))
+        print(f"🗑️  Shedding {len(shed)} clip(s) older than {ADMISSION_SHED_SECONDS}s")
+    return kept, shed
+
+def transcribe_batch(payloads):
+    '''Transcribe a batch of parsed payloads; returns their transcripts.'''
+    for payload in payloads:
+        mark(payload.get("timings"), "dequeued")
+        print(payload)
 
+    # Clips whose audio cannot be loaded fail on their own; the rest are decoded in windows
+    transcripts = [None] * len(payloads)
+    clips = []
+    for index, payload in enumerate(payloads):
+        try:
+            clips.append((index, load_audio(payload)))
         except Exception as e:
-            TEXT_ERROR = f"Transcription error: {e}"
-            print(f"❌ {TEXT_ERROR}")
-            TEXT, SRC_LANG = "", None
-
-        finally:
-            if file_path and os.path.exists(file_path):
-                os.remove(file_path)
-
-        # — Translation —
-        if TEXT and SRC_LANG:
-            TGT_LANG = "eng_Latn" if SRC_LANG != "eng_Latn" else "arb_Arab"
-            print(f"🔄 Translating from {SRC_LANG} to {TGT_LANG}")
-
-            tokenizer.src_lang = SRC_LANG
-            tokenizer.tgt_lang = TGT_LANG
-
-            inputs = tokenizer(TEXT, return_tensors="pt", padding=True)
-            if DEVICE == "cuda":
-                inputs = {k: v.to(DEVICE) for k, v in inputs.items()}
-
-            with torch.no_grad():
-                outputs = translator.generate(
-                    **inputs,
-                    forced_bos_token_id=tokenizer.convert_tokens_to_ids(TGT_LANG),
-                    max_length=512
-                )
-            TRANSLATION = tokenizer.batch_decode(outputs, skip_special_tokens=True)[0].strip()
-            if not TRANSLATION:
-                TRANSLATION_ERROR = "ERROR: Translation returned empty string"
-                print("❌ Translation failed.")
-            else:
-                print(f"✅ Translated text: {TRANSLATION}")
-
-        elapsed = round(time.perf_counter() - start_time, 2)
-        print(f"✅ Done in {elapsed}s: {speaker_id}")
-
-        result = {
-            "speaker_id": speaker_id,
-            "start_timestamp": timestamp,
-            "text": TEXT,
-            "text_error": TEXT_ERROR,
-            "translation": TRANSLATION or "[Translation failed]",
-            "translation_error": TRANSLATION_ERROR,
-            "language": SRC_LANG,
-            "raw_language": LANG,
-            "language_confidence": LANG_CONF,
-        }
-
-        redis_client.rpush("translator:unmerged", json.dumps(result))
-
-except KeyboardInterrupt:
-    print("\n🛑 Received KeyboardInterrupt — shutting down gracefully.")
-finally:
-    if DEVICE == "cuda":
-        print("🧹 Releasing GPU memory...")
-        torch.cuda.empty_cache()
-    print("👋 Shutdown complete.")
+            transcripts[index] = failed_transcript(f"Transcription error: {e}")
+            mark(payload.get("timings"), "asr_done")
+
+    on_partial = publish_partial if STREAM_PARTIALS else None
+    positions = {id(payloads[index]): index for index, _ in clips}
+    for window in plan_windows([(payloads[index], audio) for index, audio in clips]):
+        for (payload, _), transcript in zip(window, transcribe_window(window, on_partial)):
+            transcripts[positions[id(payload)]] = transcript
+            mark(payload.get("timings"), "asr_done")
+    return transcripts
+
+def finish_batch(batch, payloads, transcripts, start_time, shed=()):
+    '''Translate and publish a transcribed batch, then ack it and delete its audio (and that of shed clips).'''
+    if payloads:
+        translate_batch(transcripts)
+        for payload in payloads:
+            mark(payload.get("timings"), "translated")
+
+        pipe = redis_client.pipeline(transaction=False)
+        for payload, transcript in zip(payloads, transcripts):
+            result = build_result(payload, transcript)
+            pipe.rpush(unmerged_queue_for_room(merger_nodes, result["room_id"]), wire.dumps("blerb", result))
+        pipe.execute()
+
+    # Only ack once results are published so a crash above redelivers the items,
+    # and keep the audio until then so a redelivered item can still be decoded
+    queue_consumer.ack(*batch)
+    for payload in (*payloads, *shed):
+        remove_audio(payload)
+
+    BATCH_SECONDS.labels("transcriber").observe(time.perf_counter() - start_time)
+    PROCESSED_TOTAL.labels("transcriber").inc(len(payloads))
+    elapsed = round(time.perf_counter() - start_time, 2)
+    speakers = ", ".join(str(payload.get("speaker_id")) for payload in payloads)
+    print(f"✅ Done in {elapsed}s: {speakers}")
+
+def process_batch(batch):
+    '''Transcribe, translate and publish a batch of raw queue items, then ack them.
+
+    While NLLB is still loading, the transcripts go out as partials right away
+    and the batch waits, unacked, in `deferred_batches` for translation.'''
+    start_time = time.perf_counter()
+    follow_admission()
+    payloads, shed = shed_stale(parse_batch(batch))
+    if DEGRADED:
+        record_admission("degraded", len(payloads))
+    transcripts = transcribe_batch(payloads)
+    if translator_ready() or not payloads:
+        finish_batch(batch, payloads, transcripts, start_time, shed)
+        return
+
+    for payload, transcript in zip(payloads, transcripts):
+        if transcript["text"]:
+            publish_partial(payload, transcript["text"], transcript["lang"])
+    deferred_batches.append((batch, payloads, transcripts, start_time, shed))
+    print(f"⏸️  Translator still loading; {len(deferred_batches)} batch(es) waiting for translation")
+
+def flush_deferred_batches():
+    '''Translate and publish batches held back while NLLB was loading.
+
+    Waits for NLLB once MAX_DEFERRED_BATCHES are held, so claims stay bounded.'''
+    if not deferred_batches:
+        return
+    model_registry.raise_if_failed("nllb")
+    if not translator_ready():
+        if len(deferred_batches) < MAX_DEFERRED_BATCHES:
+            return
+        print(f"⏳ {len(deferred_batches)} batch(es) held; waiting for the translator")
+        model_registry.wait("nllb")
+    while deferred_batches:
+        finish_batch(*deferred_batches.pop(0))
+
+# ─── Main Loop ───────────────────────────────────────────────────────────────
+def main(profile=None):
+    '''Consume translator:queue until interrupted.'''
+    if profile:
+        use_profile(profile)
+    load_models()
+    serve_metrics(METRICS_PORT, health=model_registry.health)
+    track_queue_depth(redis_client, TRANSCRIBER_QUEUE)
+    queue_consumer.recover()
+    queue_consumer.start_heartbeat()
+    admission.start()
+    try:
+        # Translation is not needed to start; NLLB keeps loading in the background
+        model_registry.wait("whisper")
+        print(f"🔑 Consuming {TRANSCRIBER_QUEUE} as {queue_consumer.consumer_id}")
+        while True:
+            batch = collect_batch()
+            if batch:
+                process_batch(batch)
+            flush_deferred_batches()
+
+    except KeyboardInterrupt:
+        print("\n🛑 Received KeyboardInterrupt — shutting down gracefully.")
+    finally:
+        # Hand unfinished (and deferred) claims straight back so another worker picks them up
+        admission.stop()
+        queue_consumer.stop()
+        if DEVICE == "cuda":
+            print("🧹 Releasing GPU memory...")
+            torch.cuda.empty_cache()
+        print("👋 Shutdown complete.")
+
+def prefetch(profile=None):
+    '''Download and convert a profile's models into MODEL_CACHE_DIR, then exit (e.g. at image build).'''
+    if profile:
+        use_profile(profile)
+    load_models()
+    model_registry.wait("whisper")
+    model_registry.wait("nllb")
+    print(f"📦 Models for profile {PROFILE['name']} cached in {MODEL_CACHE_DIR}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profile", choices=sorted(PROFILES),
+                        help="inference profile (default: TRANSCRIBER_PROFILE, else accurate)")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="download and convert the profile's models, then exit")
+    args = parser.parse_args()
+    if args.prefetch:
+        prefetch(args.profile)
+    else:
+        main(args.profile)
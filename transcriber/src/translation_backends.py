@@ -0,0 +1,92 @@
+'''NLLB translation backends selected by the transcriber profile.
+
+"transformers" runs the Hugging Face model as-is (fp32 on CPU, moved to CUDA
+when available). "ctranslate2" runs the same weights converted once to a
+quantized CTranslate2 model, which is several times faster on CPU. Both take
+a batch of sentences and return their translations in order.
+'''
+import os
+import sys
+import ctranslate2
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.model_registry import MODEL_CACHE_DIR, local_model_path
+
+MAX_LENGTH_RATIO = 2.0  # Output tokens allowed per input token, plus a small constant
+
+def max_output_tokens(input_tokens):
+    '''Generation length limit for a batch whose longest input has `input_tokens` tokens.'''
+    return int(input_tokens * MAX_LENGTH_RATIO) + 10
+
+class TransformersBackend:
+    '''NLLB through transformers `generate`.'''
+
+    def __init__(self, model_name, device):
+        self.device = device
+        model_path = local_model_path(model_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_path)
+        if device == "cuda":
+            self.model = self.model.to(device)
+
+    def translate(self, sentences, src_lang, tgt_lang, beam_size):
+        '''Translate sentences with one padded generate call.'''
+        self.tokenizer.src_lang = src_lang
+        self.tokenizer.tgt_lang = tgt_lang
+        inputs = self.tokenizer(sentences, return_tensors="pt", padding=True)
+        if self.device == "cuda":
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                forced_bos_token_id=self.tokenizer.convert_tokens_to_ids(tgt_lang),
+                max_new_tokens=max_output_tokens(inputs["input_ids"].shape[1]),
+                num_beams=beam_size,
+                do_sample=False
+            )
+        return [text.strip() for text in self.tokenizer.batch_decode(outputs, skip_special_tokens=True)]
+
+class CTranslate2Backend:
+    '''NLLB through a quantized CTranslate2 model, converted into MODEL_CACHE_DIR on first use.'''
+
+    def __init__(self, model_name, device, compute_type, threads=0):
+        model_path = local_model_path(model_name)
+        model_dir = os.path.join(MODEL_CACHE_DIR, f"{model_name.replace('/', '--')}-ct2-{compute_type}")
+        if not os.path.exists(os.path.join(model_dir, "model.bin")):
+            print(f"🛠️  Converting {model_name} to CTranslate2 ({compute_type}) in {model_dir}")
+            ctranslate2.converters.TransformersConverter(model_path).convert(
+                model_dir, quantization=compute_type, force=True
+            )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.translator = ctranslate2.Translator(
+            model_dir, device=device, compute_type=compute_type, intra_threads=threads
+        )
+
+    def translate(self, sentences, src_lang, tgt_lang, beam_size):
+        '''Translate sentences in one batch; CTranslate2 handles the padding.'''
+        self.tokenizer.src_lang = src_lang
+        source = [self.tokenizer.convert_ids_to_tokens(self.tokenizer.encode(sentence)) for sentence in sentences]
+        results = self.translator.translate_batch(
+            source,
+            target_prefix=[[tgt_lang]] * len(source),
+            beam_size=beam_size,
+            max_decoding_length=max_output_tokens(max(len(tokens) for tokens in source))
+        )
+        # Each hypothesis starts with the forced target-language token
+        return [
+            self.tokenizer.decode(
+                self.tokenizer.convert_tokens_to_ids(result.hypotheses[0][1:]), skip_special_tokens=True
+            ).strip()
+            for result in results
+        ]
+
+def load_translation_backend(profile, device, threads=0):
+    '''Build the NLLB backend a profile asks for.'''
+    if profile["nllb_backend"] == "ctranslate2":
+        return CTranslate2Backend(profile["nllb_model"], device, profile["nllb_compute_type"], threads)
+    if profile["nllb_backend"] == "transformers":
+        return TransformersBackend(profile["nllb_model"], device)
+    raise ValueError(f"Unknown NLLB backend {profile['nllb_backend']!r}")
@@ -0,0 +1,98 @@
+'''Translation cache keyed on normalized text, language pair and model.
+
+Short phrases ("yes", "okay", "thank you") repeat constantly within and across
+sessions, so the transcriber looks translations up here before calling NLLB.
+Two tiers: an in-process LRU with a TTL, backed by an optional Redis tier that
+all workers share. Redis hits are promoted into the local LRU.
+'''
+import hashlib
+import time
+import unicodedata
+from collections import OrderedDict
+from prometheus_client import Counter
+
+CACHE_PREFIX = "translator:mtcache"
+
+CACHE_LOOKUPS = Counter(
+    "translator_translation_cache_total", "Translation cache lookups by outcome", ["result"]
+)
+
+def normalize(text):
+    '''Fold the differences that do not change a translation: Unicode form, case and whitespace.'''
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+class TranslationCache:
+    '''LRU + optional Redis cache of translations.
+
+    `max_entries=0` disables the local tier; `redis_client=None` or
+    `redis_ttl=0` disables the shared one.'''
+
+    def __init__(self, model_id, max_entries=10000, ttl_seconds=3600, redis_client=None, redis_ttl=86400):
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis_client = redis_client if redis_ttl else None
+        self.redis_ttl = redis_ttl
+        self.entries = OrderedDict()
+
+    def key(self, text, src_lang, tgt_lang):
+        '''Cache key of one translation; also used as its Redis key.'''
+        digest = hashlib.sha1(normalize(text).encode("utf-8")).hexdigest()
+        return f"{CACHE_PREFIX}:{self.model_id}:{src_lang}:{tgt_lang}:{digest}"
+
+    def _get_local(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        translation, expires_at = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return translation
+
+    def _put_local(self, key, translation):
+        if not self.max_entries:
+            return
+        self.entries[key] = (translation, time.monotonic() + self.ttl_seconds)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_many(self, keys):
+        '''Look up several keys at once; returns translations (None on a miss) in order.
+
+        Costs at most one Redis round trip, for the keys missing locally.'''
+        results = [self._get_local(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        CACHE_LOOKUPS.labels("hit_local").inc(len(keys) - len(missing))
+        if missing and self.redis_client is not None:
+            try:
+                remote = self.redis_client.mget([keys[i] for i in missing])
+            except Exception as e:
+                print(f"⚠️ Translation cache lookup failed: {e}")
+                remote = [None] * len(missing)
+            for i, translation in zip(missing, remote):
+                if translation is not None:
+                    results[i] = translation
+                    self._put_local(keys[i], translation)
+                    CACHE_LOOKUPS.labels("hit_redis").inc()
+        CACHE_LOOKUPS.labels("miss").inc(results.count(None))
+        return results
+
+    def put_many(self, items):
+        '''Store (key, translation) pairs in both tiers with one Redis round trip.'''
+        items = [(key, translation) for key, translation in items if translation]
+        if not items:
+            return
+        for key, translation in items:
+            self._put_local(key, translation)
+        if self.redis_client is None:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, translation in items:
+                pipe.set(key, translation, ex=self.redis_ttl)
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️ Translation cache store failed: {e}")
@@ -0,0 +1,88 @@
+'''Launches a pool of transcriber worker processes against translator:queue.'''
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+RESTART_BACKOFF_SECONDS = 5
+
+def run_worker(consumer_id, cpu_threads, metrics_port):
+    '''Entry point for one worker process; each process loads its own models.'''
+    os.environ["CONSUMER_ID"] = consumer_id
+    os.environ["METRICS_PORT"] = str(metrics_port)
+    if cpu_threads:
+        os.environ.setdefault("WHISPER_CPU_THREADS", str(cpu_threads))
+        os.environ.setdefault("TORCH_NUM_THREADS", str(cpu_threads))
+    import transcriber_worker  # pylint: disable=import-outside-toplevel
+    transcriber_worker.main()
+
+def start_worker(ctx, consumer_id, cpu_threads, metrics_port):
+    '''Spawn a worker process with a stable consumer id and metrics port.'''
+    process = ctx.Process(target=run_worker, args=(consumer_id, cpu_threads, metrics_port), name=consumer_id)
+    process.start()
+    print(f"🚀 Started {consumer_id} (pid {process.pid})")
+    return process
+
+def main():
+    '''Run K workers and restart any that exit until interrupted.'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("TRANSCRIBER_WORKERS", "1")),
+                        help="number of worker processes to run on this host")
+    parser.add_argument("--cpu-threads", type=int, default=None,
+                        help="inference threads per worker (default: cores / workers)")
+    parser.add_argument("--host-id", default=os.getenv("WORKER_HOST_ID", socket.gethostname()),
+                        help="prefix for consumer ids; must be unique per host")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", "9110")),
+                        help="metrics port of the first worker; worker N serves on this + N")
+    parser.add_argument("--profile", default=None,
+                        help="inference profile for every worker (see profiles.py)")
+    args = parser.parse_args()
+
+    if args.profile:
+        # Spawned workers inherit the environment
+        os.environ["TRANSCRIBER_PROFILE"] = args.profile
+
+    cpu_threads = args.cpu_threads
+    if cpu_threads is None:
+        cpu_threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    # Spawn so every worker gets a clean interpreter (CUDA does not survive fork)
+    ctx = multiprocessing.get_context("spawn")
+    # Slot ids are stable across restarts, so a restarted worker recovers its own claims
+    workers = {
+        f"{args.host_id}-{slot}": None for slot in range(args.workers)
+    }
+    metrics_ports = {
+        consumer_id: args.metrics_port + slot for slot, consumer_id in enumerate(workers)
+    }
+
+    def shutdown(signum=None, frame=None):
+        print("\n🛑 Stopping worker pool...")
+        for process in workers.values():
+            if process and process.is_alive():
+                process.terminate()
+        for process in workers.values():
+            if process:
+                process.join(timeout=30)
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    print(f"👷 Launching {args.workers} transcriber worker(s) with {cpu_threads} thread(s) each")
+    for consumer_id in workers:
+        workers[consumer_id] = start_worker(ctx, consumer_id, cpu_threads, metrics_ports[consumer_id])
+
+    while True:
+        time.sleep(RESTART_BACKOFF_SECONDS)
+        for consumer_id, process in workers.items():
+            if not process.is_alive():
+                print(f"💥 {consumer_id} exited with code {process.exitcode}; restarting")
+                workers[consumer_id] = start_worker(ctx, consumer_id, cpu_threads, metrics_ports[consumer_id])
+
+if __name__ == "__main__":
+    main()
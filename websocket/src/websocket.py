@@ -1,13 +1,39 @@
 '''WebSocket server for real-time updates using FastAPI and Redis.'''
 import asyncio
-import hashlib
-from typing import List
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+import os
+import sys
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from fastapi import FastAPI, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import redis
+import redis.asyncio as redis
+from prometheus_client import Counter, Gauge
 
-app = FastAPI()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.keys import (
+    DEFAULT_ROOM, INDEX_PREFIX, final_lines, line_index, line_key, room_from_channel, update_index, update_seq,
+    updates_channel
+)
+from common.metrics import observe_delivery, render_metrics
+from common.retention import CLEAR_BATCH, pick_lines, queue_line_reads, room_keys
+from common import wire
+
+SEND_QUEUE_SIZE = 256  # Messages buffered per client before it is considered too slow
+CATCH_UP_PAGE_SIZE = 500  # Lines fetched per round trip when a client catches up
+HISTORY_PAGE_SIZE = 50
+RESUBSCRIBE_DELAY_SECONDS = 1
+
+@asynccontextmanager
+async def lifespan(_app):
+    '''Runs the single shared Redis subscriber for the lifetime of the process.'''
+    task = asyncio.create_task(relay_updates())
+    yield
+    task.cancel()
+    await redis_client.aclose()
+    await redis_binary.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend (adjust origin as needed)
 app.add_middleware(
@@ -20,9 +46,211 @@ app.add_middleware(
 
 # Redis setup
 redis_client = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+# Lines and updates may be msgpack (see common/wire.py), so they are read undecoded
+redis_binary = redis.Redis(host="localhost", port=6379, db=0, decode_responses=False)
+
+# Track connected WebSocket clients and their bounded send queues, per room
+clients: Dict[str, Dict[WebSocket, asyncio.Queue]] = {}
+
+def client_count():
+    '''Number of connected clients across all rooms.'''
+    return sum(len(room_clients) for room_clients in clients.values())
+
+CONNECTED_CLIENTS = Gauge("translator_websocket_clients", "Connected WebSocket clients")
+CONNECTED_CLIENTS.set_function(client_count)
+SEND_BACKLOG = Gauge("translator_websocket_send_backlog", "Messages queued for clients but not yet sent")
+SEND_BACKLOG.set_function(lambda: sum(q.qsize() for room in clients.values() for q in room.values()))
+DROPPED_CLIENTS = Counter("translator_websocket_dropped_clients_total", "Clients dropped for a full send queue")
+SENT_BYTES = Counter("translator_websocket_sent_bytes_total", "Bytes sent to clients", ["format"])
+
+# ─── Frames ──────────────────────────────────────────────────────────────────
+# Clients pick an encoding with ?format=json (default, what old frontends
+# expect) or ?format=msgpack (binary frames, see /wire/schema), and opt into
+# deltas with ?deltas=1: an update that only extends a line's text is then
+# sent as {"type": "delta", "text_append": ..., "translation_append": ...}
+# against the line's previous version (`base_seq`) instead of the whole line.
+WIRE_FORMATS = ("json", "msgpack")
+
+# Last version broadcast of each open line, per room: (speaker_id, start_timestamp) -> line
+line_versions: Dict[str, Dict[tuple, dict]] = {}
+
+def line_delta(room_id, line):
+    '''The delta from the line's previous broadcast to `line`, or None if it must be sent whole.'''
+    versions = line_versions.setdefault(room_id, {})
+    line_id = (line.get("speaker_id"), line.get("start_timestamp"))
+    previous = versions.pop(line_id, None)
+    if not line.get("final"):
+        versions[line_id] = line
+    if previous is None or line.get("seq") is None:
+        return None
+    text, translation = line.get("text") or "", line.get("translation") or ""
+    old_text, old_translation = previous.get("text") or "", previous.get("translation") or ""
+    if not text.startswith(old_text) or not translation.startswith(old_translation):
+        return None
+    return {
+        "type": "delta",
+        "speaker_id": line_id[0],
+        "start_timestamp": line_id[1],
+        "seq": line["seq"],
+        "base_seq": previous.get("seq"),
+        "partial": line.get("partial"),
+        "final": line.get("final"),
+        "text_append": text[len(old_text):],
+        "translation_append": translation[len(old_translation):],
+    }
+
+class Update:
+    '''One published message, decoded once and encoded at most once per client format.'''
+
+    def __init__(self, raw, message, delta=None):
+        self.raw = raw
+        self.message = message
+        self.delta = delta
+        self.frames = {}
+
+    def frame(self, wire_format, deltas):
+        '''The frame for a client: str for JSON, bytes for msgpack.'''
+        use_delta = deltas and self.delta is not None
+        key = (wire_format, use_delta)
+        if key not in self.frames:
+            if wire_format == "json" and not use_delta and self.raw[:1] in ("{", b"{"):
+                # Already JSON: pass it through as published
+                self.frames[key] = self.raw.decode() if isinstance(self.raw, bytes) else self.raw
+            else:
+                kind = "delta" if use_delta else "line"
+                self.frames[key] = wire.dumps(kind, self.delta if use_delta else self.message, wire_format)
+        return self.frames[key]
+
+async def send_frame(websocket, frame):
+    '''Send a text (JSON) or binary (msgpack) frame.'''
+    if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+        SENT_BYTES.labels("msgpack").inc(len(frame))
+    else:
+        await websocket.send_text(frame)
+        SENT_BYTES.labels("json").inc(len(frame))
+
+def broadcast(room_id, message):
+    '''Queues a message once for every client in a room; clients whose queue is full are dropped.
+
+    Messages are queued as (seq, update, timings) so each client can skip
+    updates its catch-up already covered and report the line's delivery
+    latency. Clear notices carry no seq and always go out.'''
+    room_clients = clients.get(room_id)
+    if not room_clients:
+        line_versions.pop(room_id, None)
+        return
+    try:
+        parsed = wire.loads(message)
+    except ValueError:
+        print("⚠️ Could not decode update:", message)
+        return
+    if parsed.get("type") == "clear":
+        line_versions.pop(room_id, None)
+        update = Update(message, parsed)
+    else:
+        update = Update(message, parsed, line_delta(room_id, parsed))
+    seq, timings = parsed.get("seq"), parsed.get("timings")
+    for client, queue in list(room_clients.items()):
+        try:
+            queue.put_nowait((seq, update, timings))
+        except asyncio.QueueFull:
+            print("❌ Dropped a slow client: send queue full")
+            DROPPED_CLIENTS.inc()
+            room_clients.pop(client, None)
+            # Wake the client's sender so it closes the socket
+            queue.get_nowait()
+            queue.put_nowait(None)
+
+# The shared subscriber, connected to the channel of each room that has clients
+subscriber: Optional[redis.client.PubSub] = None
+
+async def subscribe_room(room_id):
+    '''Start relaying a room's updates; called when its first client connects.'''
+    if subscriber is not None:
+        await subscriber.subscribe(updates_channel(room_id))
+        print(f"📡 Subscribed to {updates_channel(room_id)}")
 
-# Track connected WebSocket clients
-clients: List[WebSocket] = []
+async def unsubscribe_room(room_id):
+    '''Stop relaying a room's updates; called when its last client leaves.'''
+    if subscriber is not None and room_id not in clients:
+        await subscriber.unsubscribe(updates_channel(room_id))
+        print(f"📴 Unsubscribed from {updates_channel(room_id)}")
+
+async def relay_updates():
+    '''Fans each update on a subscribed room's channel out to that room's clients.
+
+    Only rooms with clients connected to this process are subscribed, so a
+    process never receives traffic for rooms it does not serve. After a
+    reconnect every room that still has clients is subscribed again.'''
+    global subscriber
+    while True:
+        try:
+            async with redis_binary.pubsub() as pubsub:
+                subscriber = pubsub
+                for room_id in list(clients):
+                    await subscribe_room(room_id)
+                while True:
+                    if not pubsub.subscribed:
+                        await asyncio.sleep(RESUBSCRIBE_DELAY_SECONDS)
+                        continue
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message["type"] == "message":
+                        broadcast(room_from_channel(message["channel"].decode()), message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Subscriber error, resubscribing: {e}")
+            subscriber = None
+            await asyncio.sleep(RESUBSCRIBE_DELAY_SECONDS)
+
+async def read_lines(room_id, keys):
+    '''Fetch lines by key, open or compacted, in one round trip.'''
+    if not keys:
+        return []
+    pipe = redis_binary.pipeline(transaction=False)
+    queue_line_reads(pipe, room_id, keys)
+    return pick_lines(*await pipe.execute())
+
+async def catch_up(websocket, room_id, cursor, wire_format="json"):
+    '''Sends every line of a room written after `cursor`, in pages, and returns the seq it caught up to.
+
+    A reconnecting client passes the highest seq it has seen, so this costs
+    O(missed lines); a fresh client starts at 0 and receives the whole session.'''
+    caught_up_to = cursor
+    while True:
+        page = await redis_client.zrangebyscore(
+            update_index(room_id), f"({caught_up_to}", "+inf",
+            start=0, num=CATCH_UP_PAGE_SIZE, withscores=True
+        )
+        if not page:
+            return caught_up_to
+        keys = [key for key, _ in page]
+        for value in await read_lines(room_id, keys):
+            if value:
+                await send_frame(websocket, Update(value, wire.loads(value)).frame(wire_format, False))
+        caught_up_to = int(page[-1][1])
+        if len(page) < CATCH_UP_PAGE_SIZE:
+            return caught_up_to
+
+async def pump(websocket, queue, caught_up_to, wire_format="json", deltas=False):
+    '''Sends queued messages to one client, in its format, until it is dropped.'''
+    while True:
+        message = await queue.get()
+        if message is None:
+            await websocket.close()
+            return
+        seq, update, timings = message
+        # Anything at or below the catch-up point was already sent in its latest form
+        if seq is not None and seq <= caught_up_to:
+            continue
+        await send_frame(websocket, update.frame(wire_format, deltas))
+        observe_delivery(timings)
+
+async def drain_incoming(websocket):
+    '''Reads (and ignores) client frames so disconnects are noticed.'''
+    while True:
+        await websocket.receive_text()
 
 @app.get("/ping")
 def ping():
@@ -30,71 +258,149 @@ def ping():
     return {"status": "pong"}
 
 
+@app.get("/metrics")
+def metrics():
+    '''Prometheus scrape endpoint: delivery latency, end-to-end latency and client counts.'''
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
+@app.get("/transcript")
+async def transcript_history(
+    room: str = DEFAULT_ROOM,
+    before: Optional[int] = None,
+    before_key: Optional[str] = None,
+    limit: int = HISTORY_PAGE_SIZE
+):
+    '''Pages backwards through a room's transcript by start timestamp.
+
+    Pass the returned `next_before` and `next_before_key` as `before` and
+    `before_key` to fetch the previous page. Paging by (timestamp, key) keeps
+    lines that start in the same millisecond as a page boundary; with
+    `before` alone, every line at that timestamp is skipped.'''
+    skip = 0
+    if before is None:
+        newest = "+inf"
+    elif before_key is None:
+        newest = f"({before}"
+    else:
+        # Lines sharing the boundary timestamp come in reverse key order; skip those already sent
+        newest = before
+        ties = await redis_client.zrevrangebyscore(line_index(room), before, before)
+        skip = sum(1 for key in ties if key >= before_key)
+    page = await redis_client.zrevrangebyscore(
+        line_index(room), newest, "-inf", start=skip, num=limit, withscores=True
+    )
+    values = await read_lines(room, [key for key, _ in page])
+    lines = [wire.loads(value) for value in values if value]
+    lines.reverse()
+    more = len(page) == limit
+    return {
+        "lines": lines,
+        "next_before": int(page[-1][1]) if more else None,
+        "next_before_key": page[-1][0] if more else None,
+        "cursor": int(await redis_client.get(update_seq(room)) or 0),
+    }
+
+
+async def indexed_rooms():
+    '''Every room that has an index (or seq counter) in Redis.'''
+    rooms = set()
+    async for key in redis_client.scan_iter(f"{INDEX_PREFIX}:*", count=CLEAR_BATCH):
+        room_id = key[len(INDEX_PREFIX) + 1:].rpartition(":")[0]
+        if key in (line_index(room_id), update_index(room_id), final_lines(room_id), update_seq(room_id)):
+            rooms.add(room_id)
+    return rooms
+
+
 @app.get("/admin/clear-translations")
-async def clear_transcripts():
-    '''Clears all translation data from Redis and notifies connected clients.'''
-    deleted_keys = []
+async def clear_transcripts(room: Optional[str] = None):
+    '''Clears transcripts from Redis (one room, or every room) and notifies connected clients.
 
-    for key in redis_client.scan_iter("translator:*"):
-        redis_client.delete(key)
-        deleted_keys.append(key)
+    Only each room's lines, its indexes and its compacted final lines are
+    removed. Queues, consumer state, caches and the seq counters (so existing
+    client cursors stay valid) are left alone. Keys are removed with UNLINK in
+    batches of CLEAR_BATCH, so Redis frees them in the background, and only
+    the count is returned.'''
+    deleted = 0
+    rooms = {room} if room else await indexed_rooms() | set(clients)
 
-    # Notify all connected clients
-    for client in clients.copy():
-        try:
-            await client.send_json({"type": "clear"})
-        except Exception:
-            clients.remove(client)
+    for room_id in rooms:
+        batch = room_keys(room_id)
+        async for key in redis_client.scan_iter(line_key(room_id, "*", "*"), count=CLEAR_BATCH):
+            batch.append(key)
+            if len(batch) >= CLEAR_BATCH:
+                deleted += await redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += await redis_client.unlink(*batch)
+
+    # Notify clients on every WebSocket server through the rooms' channels
+    for room_id in rooms:
+        await redis_client.publish(updates_channel(room_id), wire.dumps("line", {"type": "clear"}))
 
     return JSONResponse({
         "status": "cleared",
-        "deleted": deleted_keys,
-        "count": len(deleted_keys)
+        "count": deleted,
+        "rooms": len(rooms)
     })
 
 
+@app.get("/wire/schema")
+def wire_schema():
+    '''Field order of each message kind, for clients decoding msgpack frames.'''
+    return {"version": wire.WIRE_VERSION, "fields": wire.FIELDS}
+
+
 @app.websocket("/ws/transcript")
-async def transcript_ws(websocket: WebSocket):
-    '''Handles WebSocket connections for real-time transcription updates.'''
+async def transcript_ws(
+    websocket: WebSocket,
+    room: str = DEFAULT_ROOM,
+    cursor: int = 0,
+    wire_format: str = Query("json", alias="format"),
+    deltas: bool = False
+):
+    '''Handles WebSocket connections for real-time transcription updates of one room.
+
+    Clients resume with `?cursor=<highest seq seen>` to receive only what they missed.'''
+    if wire_format not in WIRE_FORMATS or (wire_format == "msgpack" and wire.msgpack is None):
+        await websocket.close(code=1003)
+        return
     await websocket.accept()
-    clients.append(websocket)
-    print(f"🔌 Client connected. Total: {len(clients)}")
+    queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+    # Register before the catch-up read so no update falls in between;
+    # the pump skips whatever the catch-up already covered.
+    first_client = room not in clients
+    clients.setdefault(room, {})[websocket] = queue
+    print(f"🔌 Client connected to {room}. Total: {client_count()}")
 
+    tasks = []
     try:
-        content_hashes = {}  # Track last seen hash per key
-        while True:
-            await asyncio.sleep(0.5)
-            keys = redis_client.keys("translator:transcription:*")
-            updated = []
-            for key in keys:
-                value = redis_client.get(key)
-                if not value:
-                    continue
-
-                hash_ = hashlib.md5(value.encode()).hexdigest()
-                if content_hashes.get(key) != hash_:
-                    content_hashes[key] = hash_
-                    updated.append(value)
-
-            if updated:
-                alive_clients = []
-                for client in clients:
-                    try:
-                        for message in updated:
-                            await client.send_text(message)
-                        alive_clients.append(client)
-                    except Exception as e:
-                        print(f"❌ Dropped a client: {e}")
-                clients[:] = alive_clients  # Replace with only live ones
+        if first_client:
+            await subscribe_room(room)
+        caught_up_to = await catch_up(websocket, room, cursor, wire_format)
+        tasks = [
+            asyncio.create_task(pump(websocket, queue, caught_up_to, wire_format, deltas)),
+            asyncio.create_task(drain_incoming(websocket)),
+        ]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
 
     except WebSocketDisconnect:
-        if websocket in clients:
-            clients.remove(websocket)
-        print(f"❌ Client disconnected. Remaining: {len(clients)}")
+        print("❌ Client disconnected.")
     except Exception as e:
         print(f"❌ Error in WebSocket loop: {e}")
-        if websocket in clients:
-            clients.remove(websocket)
+    finally:
+        for task in tasks:
+            task.cancel()
+        room_clients = clients.get(room, {})
+        room_clients.pop(websocket, None)
+        if not room_clients:
+            clients.pop(room, None)
+            line_versions.pop(room, None)
+            await unsubscribe_room(room)
+        print(f"👥 Remaining clients: {client_count()}")
 
 if __name__ == "__main__":
     import uvicorn